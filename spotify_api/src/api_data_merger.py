@@ -1,14 +1,24 @@
 import pandas as pd
 from tqdm import tqdm
+import asyncio
 import threading
 import queue
 import time
+from async_enrichment import (
+    AsyncDiscogsProvider,
+    AsyncMusicBrainzProvider,
+    AsyncSpotifyProvider,
+    EnrichmentEngine,
+)
 from musicbrainzngs_api import MusicBrainzClient
 from spotify_api import SpotipyClient
 from discogs_apli import DiscogsClient
+from lookup_cache import CachedMetadataClient, CachedSpotifyClient, metadata_key, track_key
+from table_io import write_table
 
 class APIDataMerger():
-    def __init__(self, df, spotify_client_id, spotify_client_secret, discogs_token):
+    def __init__(self, df, spotify_client_id, spotify_client_secret, discogs_token, lookup_cache=None,
+                 journal=None):
         self.df = df
         self.df_length = len(df)
 
@@ -17,6 +27,12 @@ class APIDataMerger():
 
         self.discogs_token = discogs_token
 
+        # Cache persistent de consultes (YearLookupCache) compartida entre execucions
+        self.lookup_cache = lookup_cache
+
+        # Registre de checkpoints (CheckpointJournal): si hi és, els guardats només afegeixen els anys nous
+        self.journal = journal
+
         self.stop_event = threading.Event()
 
     def _save_if_safe(self, save_path):
@@ -25,142 +41,262 @@ class APIDataMerger():
             print(f"🛑 Stop Program: DataFrame length changed from {self.df_length} to {len(self.df)}!")
             return False
 
-        self.df.to_csv(save_path, index=False)
+        if self.journal is not None:
+            # Compactació: el df complet s'escriu de forma atòmica
+            self.journal.compact(self.df, save_path)
+        else:
+            write_table(self.df, save_path)
         return True
-    
-    def _autosave_worker(self, save_path, interval=30):
+
+    def _checkpoint(self, save_path):
+        # Amb registre només cal sincronitzar-lo; sense, es guarda tot el df
+        if self.journal is not None:
+            self.journal.flush()
+            return True
+        return self._save_if_safe(save_path)
+
+    def _apply_results(self, results):
         """
-        Guarda el df cada 'interval' segons si hi ha canvis.
+        Aplica un lot de resultats (idx, year, source) amb una sola escriptura al df.
+        """
+        found = [(idx, int(year), source) for idx, year, source in results if year]
+        if not found:
+            return
+
+        self.df.loc[[idx for idx, _, _ in found], 'year'] = [year for _, year, _ in found]
+        if self.journal is not None:
+            self.journal.append_many(found)
+
+    def _apply_cached_years(self):
         """
+        Omple l'any de les files pendents que ja són a la cache, abans d'encuar cap petició.
+        Retorna {idx: proveïdors amb un resultat negatiu vigent} per a les files que queden pendents.
+        """
+        if self.lookup_cache is None:
+            return {}
+
+        pending = self.df[self.df['year'].isnull()]
+        row_keys = {
+            idx: (track_key(track_id), metadata_key(artists, track_name, album_name))
+            for idx, track_id, artists, track_name, album_name in zip(
+                pending.index, pending['track_id'], pending['artists'],
+                pending['track_name'], pending['album_name']
+            )
+        }
+        cached = self.lookup_cache.lookup_many([key for keys in row_keys.values() for key in keys])
+
+        resolved_idx = []
+        resolved_years = []
+        negatives = {}
+        for idx, keys in row_keys.items():
+            entries = [cached[key] for key in keys if key in cached]
+            year = next((entry['year'] for entry in entries if entry['year']), None)
+            if year:
+                resolved_idx.append(idx)
+                resolved_years.append(year)
+            elif entries:
+                negatives[idx] = set().union(*(entry['negative'] for entry in entries))
+
+        if resolved_idx:
+            self.df.loc[resolved_idx, 'year'] = resolved_years
+            print(f"♻️ {len(resolved_idx)} anys recuperats de la cache de consultes")
+        return negatives
+
+    def _writer_worker(self, results, pbar, save_path, interval=30, batch_size=500):
+        """
+        Únic fil que escriu al df: aplica per lots els resultats que envien els workers
+        i guarda cada 'interval' segons si hi ha canvis.
+        """
+        processed = 0
         last_saved = 0
+        last_save_time = time.time()
+        finished = False
 
-        while not self.stop_event.is_set():
-            # Comptar files amb 'year' no nul
-            processed = self.df['year'].notnull().sum()
+        while not finished:
+            try:
+                items = [results.get(timeout=1)]
+            except queue.Empty:
+                items = []
+
+            while items and len(items) < batch_size:
+                try:
+                    items.append(results.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Cada element és una llista de resultats; None indica que els workers han acabat
+            if None in items:
+                finished = True
+            batch = [result for item in items if item is not None for result in item]
 
-            if processed > last_saved + 50:
-                status = self._save_if_safe(save_path)
+            if batch:
+                self._apply_results(batch)
+                processed += len(batch)
+                pbar.update(len(batch))
+
+            if processed > last_saved + 50 and time.time() - last_save_time >= interval:
+                status = self._checkpoint(save_path)
 
                 if not status:
                     return
 
                 print(f"💾 Guardat automàtic després de {processed} cançons processades")
                 last_saved = processed
+                last_save_time = time.time()
 
-            time.sleep(interval)  # espera abans de tornar a comprovar
-
-    def _worker_spotify(self, spc, q, pbar):
+    def _worker_spotify(self, spc, q, results):
         while not self.stop_event.is_set():
             try:
-                idx = q.get(timeout=1)
+                job = q.get(timeout=1)
             except queue.Empty:
                 continue
 
-            if idx is None:
+            if job is None:
                 q.task_done()
                 break
 
-            row = self.df.loc[idx]
-            if pd.notnull(row['year']):
-                q.task_done()
-                pbar.update(1)
-                continue
-
-            year = None
-            retries = 0
-            max_retries = 5
+            # Els reintents i les esperes els gestiona el controlador de ritme del client
+            idx, track_id, _, _, _ = job
+            year = spc.get_year(track_id)
+            results.put([(idx, year, 'spotify')])
+            q.task_done()
 
-            while year is None and retries < max_retries and not self.stop_event.is_set():
-                year = spc.get_year(row['track_id'])
-                if year is None:
-                    retries += 1
-                    time.sleep(2)
+    def _worker_spotify_batch(self, spc, q, results, fallback_queues=()):
+        # Agafa fins a 50 files de la cua i les resol amb una sola petició
+        finished = False
+        while not finished and not self.stop_event.is_set():
+            try:
+                batch = [q.get(timeout=1)]
+            except queue.Empty:
+                continue
 
-            self.df.loc[idx, 'year'] = int(year) if year else None
+            while len(batch) < spc.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
 
-            q.task_done()
-            pbar.update(1)
+            if None in batch:
+                finished = True
+            jobs = [job for job in batch if job is not None]
+
+            if jobs:
+                years = spc.get_years([track_id for _, track_id, _, _, _ in jobs])
+                resolved = []
+                unresolved = []
+                for job in jobs:
+                    year = years.get(job[1], 0)
+                    if year:
+                        resolved.append((job[0], year, 'spotify'))
+                    else:
+                        unresolved.append(job)
+
+                # Les files que Spotify no troba passen als altres proveïdors
+                if fallback_queues:
+                    for i, job in enumerate(unresolved):
+                        fallback_queues[i % len(fallback_queues)].put(job)
+                else:
+                    resolved.extend((job[0], None, 'spotify') for job in unresolved)
+                results.put(resolved)
+
+            for _ in batch:
+                q.task_done()
 
-    def _worker_musicbrainz(self, mbc, q, pbar):
+    def _worker_metadata(self, client, source, q, results):
+        # Worker per a MusicBrainz i Discogs, que cerquen per artista, cançó i àlbum
         while not self.stop_event.is_set():
             try:
-                idx = q.get(timeout=1)
+                job = q.get(timeout=1)
             except queue.Empty:
                 continue
 
-            if idx is None:
+            if job is None:
                 q.task_done()
                 break
 
-            row = self.df.loc[idx]
-            if pd.notnull(row['year']):
-                q.task_done()
-                pbar.update(1)
-                continue
-
-            year = mbc.get_year(row['artists'], row['track_name'], row['album_name'])
-            self.df.loc[idx, 'year'] = int(year) if year else None
+            idx, _, artists, track_name, album_name = job
+            year = client.get_year(artists, track_name, album_name)
+            results.put([(idx, year, source)])
 
             q.task_done()
-            pbar.update(1)
-
-    def _worker_discogs(self, discogs_client, q, pbar):
-            while not self.stop_event.is_set():
-                try:
-                    idx = q.get(timeout=1)
-                except queue.Empty:
-                    continue
-
-                if idx is None:
-                    q.task_done()
-                    break
-
-                row = self.df.loc[idx]
-                if pd.notnull(row['year']):
-                    q.task_done()
-                    pbar.update(1)
-                    continue
 
-                year = discogs_client.get_year(row['artists'], row['track_name'], row['album_name'])
-                self.df.loc[idx, 'year'] = int(year) if year else None
-
-                q.task_done()
-                pbar.update(1)
-
-    def complete_dataset(self, save_path):
-        spc = SpotipyClient(self.spotify_client_id, self.spotify_client_secret, rate_limit=0.5)
-        mbc = MusicBrainzClient(rate_limit=0.9)
-        dc = DiscogsClient(user_token=self.discogs_token)
+    def _default_clients(self):
+        # Clients de Spotify, MusicBrainz i Discogs (segons entre peticions)
+        return (
+            SpotipyClient(self.spotify_client_id, self.spotify_client_secret, rate_limit=0.5),
+            MusicBrainzClient(rate_limit=0.9),
+            DiscogsClient(user_token=self.discogs_token),
+        )
+
+    def complete_dataset(self, save_path, spotify_batch=False, final_path='data/df_filtered_final.csv', clients=None):
+        if clients is None:
+            clients = self._default_clients()
+        spc, mbc, dc = clients
+
+        if self.lookup_cache is not None:
+            self._apply_cached_years()
+            spc = CachedSpotifyClient(spc, self.lookup_cache)
+            mbc = CachedMetadataClient(mbc, self.lookup_cache, 'musicbrainz')
+            dc = CachedMetadataClient(dc, self.lookup_cache, 'discogs')
 
         q_spotify = queue.Queue()
         q_musicbrainz = queue.Queue()
         q_discogs = queue.Queue()
-
-        total_tasks = sum(pd.isnull(self.df['year']))
-        pbar = tqdm(total=total_tasks, desc="Processant tracks")
-
-        for i, idx in enumerate(self.df.index):
-            if pd.notnull(self.df.loc[idx, 'year']):
-                continue
-            elif i % 3 == 0:
-                q_spotify.put(idx)
+        results = queue.Queue()
+
+        # Els workers reben tuples (idx, track_id, artists, track_name, album_name) i no llegeixen el df
+        pending = self.df[self.df['year'].isnull()]
+        positions = self.df.index.get_indexer(pending.index)
+        jobs = zip(
+            pending.index,
+            pending['track_id'],
+            pending['artists'],
+            pending['track_name'],
+            pending['album_name']
+        )
+
+        pbar = tqdm(total=len(pending), desc="Processant tracks")
+
+        for i, job in zip(positions, jobs):
+            if spotify_batch or i % 3 == 0:
+                # En mode lot, Spotify rep totes les files (50 per petició)
+                q_spotify.put(job)
             elif i % 2 == 0:
-                q_musicbrainz.put(idx)
+                q_musicbrainz.put(job)
             else:
-                q_discogs.put(idx)
+                q_discogs.put(job)
+
+        # En mode lot, MusicBrainz i Discogs reben feina fins que acaba Spotify
+        q_spotify.put(None)
+        if not spotify_batch:
+            q_musicbrainz.put(None)
+            q_discogs.put(None)
 
-        autosave_thread = threading.Thread(target=self._autosave_worker, args=(save_path, 10))
-        t_spotify = threading.Thread(target=self._worker_spotify, args=(spc, q_spotify, pbar))
-        t_musicbrainz = threading.Thread(target=self._worker_musicbrainz, args=(mbc, q_musicbrainz, pbar))
-        t_discogs = threading.Thread(target=self._worker_discogs, args=(dc, q_discogs, pbar))
+        writer_thread = threading.Thread(target=self._writer_worker, args=(results, pbar, save_path, 10))
+        if spotify_batch:
+            t_spotify = threading.Thread(
+                target=self._worker_spotify_batch,
+                args=(spc, q_spotify, results, (q_musicbrainz, q_discogs))
+            )
+        else:
+            t_spotify = threading.Thread(target=self._worker_spotify, args=(spc, q_spotify, results))
+        t_musicbrainz = threading.Thread(
+            target=self._worker_metadata, args=(mbc, 'musicbrainz', q_musicbrainz, results)
+        )
+        t_discogs = threading.Thread(target=self._worker_metadata, args=(dc, 'discogs', q_discogs, results))
 
-        autosave_thread.start()
+        writer_thread.start()
         t_spotify.start()
         t_musicbrainz.start()
         t_discogs.start()
 
         try:
-            while t_spotify.is_alive() or t_musicbrainz.is_alive() or t_discogs.is_alive():
+            while t_spotify.is_alive():
+                time.sleep(1)
+            if spotify_batch:
+                q_musicbrainz.put(None)
+                q_discogs.put(None)
+            while t_musicbrainz.is_alive() or t_discogs.is_alive():
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\n🛑 Interrupció manual detectada! Finalitzant...")
@@ -178,22 +314,111 @@ class APIDataMerger():
             t_musicbrainz.join()
             t_discogs.join()
 
-            # Ara aturem el thread d’autosave
-            autosave_thread.join()
+            # El writer aplica els resultats pendents abans d'acabar
+            results.put(None)
+            writer_thread.join()
 
-            status = self._save_if_safe(save_path)
+            status = self._checkpoint(save_path)
             if not status:
                 return
             print("💾 Progrés guardat abans de sortir")
         else:
-            # Si els workers acaben normalment, també parem l’autosave
+            # Si els workers acaben normalment, el writer buida la cua i acaba
+            results.put(None)
+            writer_thread.join()
             self.stop_event.set()
-            autosave_thread.join()
 
         pbar.close()
 
-        final_path = "data/df_filtered_final.csv"
         status = self._save_if_safe(final_path)
         if not status:
             return
-        print(f"✅ Arxiu final guardat com {final_path}")
\ No newline at end of file
+        print(f"✅ Arxiu final guardat com {final_path}")
+
+    def _default_async_providers(self):
+        # Quotes aproximades de cada API (peticions per segon)
+        return [
+            AsyncSpotifyProvider(self.spotify_client_id, self.spotify_client_secret, rate=2.0, concurrency=2),
+            AsyncMusicBrainzProvider(rate=1.0),
+            AsyncDiscogsProvider(self.discogs_token, rate=1.0),
+        ]
+
+    def complete_dataset_async(self, save_path, providers=None, autosave_interval=10,
+                               final_path='data/df_filtered_final.csv'):
+        if providers is None:
+            providers = self._default_async_providers()
+        engine = EnrichmentEngine(providers)
+
+        negatives = self._apply_cached_years()
+
+        # Les dades de cada fila s'extreuen un sol cop com a tuples. Les files amb el
+        # mateix track_id (un per cada track_genre) es consulten una sola vegada.
+        pending = self.df[self.df['year'].isnull()]
+        duplicates = pending.groupby('track_id', sort=False).groups
+        first = pending.drop_duplicates('track_id')
+        rows = list(zip(
+            first.index,
+            first['track_id'],
+            first['artists'],
+            first['track_name'],
+            first['album_name']
+        ))
+        row_info = {row[0]: row[1:] for row in rows}
+        targets = {idx: duplicates[track_id] for idx, track_id in zip(first.index, first['track_id'])}
+        tried = {idx: negatives[idx] for idx in first.index if idx in negatives}
+
+        pbar = tqdm(total=len(pending), desc="Processant tracks")
+        last_save = time.time()
+        buffer = []
+
+        def on_miss(idx, source):
+            if self.lookup_cache is None:
+                return
+            track_id, artists, track_name, album_name = row_info[idx]
+            key = track_key(track_id) if source == 'spotify' else metadata_key(artists, track_name, album_name)
+            self.lookup_cache.put(key, source, None)
+
+        def on_result(idx, year, source):
+            nonlocal last_save
+            # Els resultats s'apliquen al df per lots, no fila a fila
+            buffer.extend((target, year, source) for target in targets[idx])
+            pbar.update(len(targets[idx]))
+
+            if self.lookup_cache is not None and year:
+                track_id, artists, track_name, album_name = row_info[idx]
+                self.lookup_cache.put_many([
+                    (track_key(track_id), source, year),
+                    (metadata_key(artists, track_name, album_name), source, year),
+                ])
+
+            # Tot s'executa al fil de l'event loop: no hi ha escriptures concurrents al df
+            if len(buffer) >= 500 or time.time() - last_save > autosave_interval:
+                self._apply_results(buffer)
+                buffer.clear()
+
+            if time.time() - last_save > autosave_interval:
+                if self._checkpoint(save_path):
+                    print(f"💾 Guardat automàtic després de {pbar.n} cançons processades")
+                last_save = time.time()
+
+        try:
+            asyncio.run(engine.run(rows, on_result, self.stop_event, tried=tried, on_miss=on_miss))
+        except KeyboardInterrupt:
+            print("\n🛑 Interrupció manual detectada! Finalitzant...")
+            self.stop_event.set()
+            self._apply_results(buffer)
+            if self._checkpoint(save_path):
+                print("💾 Progrés guardat abans de sortir")
+            pbar.close()
+            return
+
+        self._apply_results(buffer)
+        pbar.close()
+
+        for name, stats in engine.stats().items():
+            print(f"📊 {name}: {stats}")
+
+        status = self._save_if_safe(final_path)
+        if not status:
+            return
+        print(f"✅ Arxiu final guardat com {final_path}")
@@ -0,0 +1,294 @@
+import asyncio
+import base64
+import time
+import aiohttp
+from rate_controller import AdaptiveRateController, parse_retry_after
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _retry_after(response, default=5):
+    return parse_retry_after(response.headers.get('Retry-After'), default)
+
+
+def _year_from_date(date):
+    if date:
+        try:
+            return int(date.split('-')[0])
+        except ValueError:
+            return 0
+    return 0
+
+
+class AsyncSpotifyProvider:
+    name = 'spotify'
+
+    def __init__(self, client_id, client_secret, rate=2.0, capacity=1, concurrency=2,
+                 api_url='https://api.spotify.com/v1', accounts_url='https://accounts.spotify.com/api/token'):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url
+        self.accounts_url = accounts_url
+        self.limiter = AdaptiveRateController(rate, capacity)
+        self.concurrency = concurrency
+        self._token = None
+        self._token_expires = 0
+
+    async def _access_token(self, session):
+        if self._token is None or time.time() >= self._token_expires:
+            credentials = base64.b64encode(f'{self.client_id}:{self.client_secret}'.encode()).decode()
+            async with session.post(
+                self.accounts_url,
+                data={'grant_type': 'client_credentials'},
+                headers={'Authorization': f'Basic {credentials}'}
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+            self._token = data['access_token']
+            self._token_expires = time.time() + data.get('expires_in', 3600) - 60
+        return self._token
+
+    async def get_year(self, session, row):
+        track_id = row[0]
+        token = await self._access_token(session)
+        async with session.get(
+            f'{self.api_url}/tracks/{track_id}',
+            headers={'Authorization': f'Bearer {token}'}
+        ) as response:
+            if response.status == 429:
+                raise RateLimited(_retry_after(response))
+            if response.status != 200:
+                return 0
+            track = await response.json()
+        return _year_from_date(track.get('album', {}).get('release_date'))
+
+
+class AsyncMusicBrainzProvider:
+    name = 'musicbrainz'
+
+    def __init__(self, rate=1.0, capacity=1, concurrency=1, api_url='https://musicbrainz.org/ws/2',
+                 user_agent='MusicEmotionProject/1.0 ( teu@email.com )'):
+        self.api_url = api_url
+        self.user_agent = user_agent
+        self.limiter = AdaptiveRateController(rate, capacity)
+        self.concurrency = concurrency
+
+    def _query(self, artist, track_name, album_name):
+        def quote(value):
+            return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+        return f'recording:{quote(track_name)} AND artist:{quote(artist)} AND release:{quote(album_name)}'
+
+    async def get_year(self, session, row):
+        _, artists, track_name, album_name = row
+        params = {'query': self._query(artists, track_name, album_name), 'limit': 3, 'fmt': 'json'}
+        async with session.get(
+            f'{self.api_url}/recording',
+            params=params,
+            headers={'User-Agent': self.user_agent}
+        ) as response:
+            if response.status in (429, 503):
+                raise RateLimited(_retry_after(response, default=1))
+            if response.status != 200:
+                return 0
+            data = await response.json()
+
+        for recording in data.get('recordings', []):
+            for release in recording.get('releases', []):
+                year = _year_from_date(release.get('date'))
+                if year:
+                    return year
+                for event in release.get('release-events', []):
+                    year = _year_from_date(event.get('date'))
+                    if year:
+                        return year
+        return 0
+
+
+class AsyncDiscogsProvider:
+    name = 'discogs'
+
+    def __init__(self, user_token, rate=1.0, capacity=1, concurrency=1, api_url='https://api.discogs.com'):
+        self.user_token = user_token
+        self.api_url = api_url
+        self.limiter = AdaptiveRateController(rate, capacity)
+        self.concurrency = concurrency
+
+    async def get_year(self, session, row):
+        _, artists, track_name, album_name = row
+        params = {
+            'artist': artists,
+            'title': track_name,
+            'release_title': album_name,
+            'type': 'release',
+            'per_page': 5,
+        }
+        headers = {
+            'Authorization': f'Discogs token={self.user_token}',
+            'User-Agent': 'MyApp/1.0'
+        }
+        async with session.get(f'{self.api_url}/database/search', params=params, headers=headers) as response:
+            # Discogs informa de la quota restant dins una finestra mòbil de 60 segons
+            remaining = response.headers.get('X-Discogs-Ratelimit-Remaining')
+            if remaining is not None and remaining.isdigit():
+                self.limiter.quota(int(remaining), 60)
+            if response.status == 429:
+                raise RateLimited(_retry_after(response, default=60))
+            if response.status != 200:
+                return 0
+            data = await response.json()
+
+        for release in data.get('results', []):
+            try:
+                year = int(release.get('year') or 0)
+            except ValueError:
+                continue
+            if year:
+                return year
+        return 0
+
+
+class EnrichmentEngine:
+    """
+    Reparteix les files pendents entre proveïdors segons la capacitat de cadascun.
+    Si un proveïdor no troba l'any, la fila passa al següent proveïdor no provat.
+    """
+    def __init__(self, providers, max_rate_limit_retries=5, connections_per_host=4):
+        self.providers = providers
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.connections_per_host = connections_per_host
+
+    def stats(self):
+        # Peticions, temps d'espera, 429 i errors de cada proveïdor
+        return {p.name: p.limiter.stats() for p in self.providers}
+
+    def _next_provider(self, tried):
+        # Proveïdor no provat amb més capacitat disponible en aquest moment
+        candidates = [p for p in self.providers if p.name not in tried]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda p: p.limiter.available())
+
+    async def _worker(self, provider, session, shared_queue, own_queues, on_result, on_miss, state):
+        own_queue = own_queues[provider.name]
+
+        while not state['done'].is_set():
+            await provider.limiter.acquire()
+
+            # Primer les files que altres proveïdors no han resolt; després la cua comuna
+            try:
+                job = own_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                try:
+                    job = shared_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    # Retornem el token i esperem feina
+                    provider.limiter.release()
+                    await asyncio.sleep(0.05)
+                    continue
+
+            idx, row, tried, rate_limited = job
+            if provider.name in tried:
+                # Aquest proveïdor ja no ha trobat la fila (per exemple, segons la cache)
+                provider.limiter.release()
+                own_queues[self._next_provider(tried).name].put_nowait(job)
+                continue
+
+            failed = False
+            try:
+                year = await provider.get_year(session, row)
+            except RateLimited as e:
+                provider.limiter.retry_after(e.retry_after)
+                if rate_limited < self.max_rate_limit_retries:
+                    own_queue.put_nowait((idx, row, tried, rate_limited + 1))
+                    continue
+                year = 0
+                failed = True
+            except Exception as e:
+                # Qualsevol error de la consulta (xarxa, token, resposta inesperada) compta com a fallada
+                # de la fila: el worker ha de continuar perquè 'pending' arribi a zero
+                print(f"Error amb {provider.name} a la fila {idx}: {type(e).__name__}: {e}")
+                provider.limiter.failure()
+                year = 0
+                failed = True
+            else:
+                provider.limiter.success()
+
+            if not year and not failed and on_miss is not None:
+                on_miss(idx, provider.name)
+
+            tried = tried | {provider.name}
+            if year:
+                on_result(idx, int(year), provider.name)
+            else:
+                fallback = self._next_provider(tried)
+                if fallback is not None:
+                    own_queues[fallback.name].put_nowait((idx, row, tried, 0))
+                    continue
+                on_result(idx, None, None)
+
+            state['pending'] -= 1
+            if state['pending'] == 0:
+                state['done'].set()
+
+    async def run(self, rows, on_result, stop_event=None, tried=None, on_miss=None):
+        """
+        rows: llista de tuples (idx, track_id, artists, track_name, album_name).
+        on_result(idx, year, source) es crida per cada fila resolta (year=None si cap proveïdor la troba).
+        tried: {idx: noms de proveïdors que no cal consultar} per a cada fila.
+        on_miss(idx, provider) es crida quan un proveïdor respon però no troba l'any.
+        """
+        tried = tried or {}
+        names = {p.name for p in self.providers}
+
+        shared_queue = asyncio.Queue()
+        own_queues = {p.name: asyncio.Queue() for p in self.providers}
+        pending = 0
+        for idx, track_id, artists, track_name, album_name in rows:
+            row_tried = frozenset(tried.get(idx, ()))
+            if names <= row_tried:
+                on_result(idx, None, None)
+                continue
+            row = (track_id, artists, track_name, album_name)
+            shared_queue.put_nowait((idx, row, row_tried, 0))
+            pending += 1
+
+        if pending == 0:
+            return
+
+        state = {'pending': pending, 'done': asyncio.Event()}
+
+        connector = aiohttp.TCPConnector(limit_per_host=self.connections_per_host)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            workers = [
+                asyncio.create_task(self._worker(p, session, shared_queue, own_queues, on_result, on_miss, state))
+                for p in self.providers
+                for _ in range(p.concurrency)
+            ]
+
+            error = None
+            while not state['done'].is_set():
+                if stop_event is not None and stop_event.is_set():
+                    state['done'].set()
+                    break
+                # Un worker només acaba abans d'hora si falla fora de la consulta (per exemple a on_result)
+                finished = [worker for worker in workers if worker.done()]
+                if finished:
+                    error = next((w.exception() for w in finished if not w.cancelled() and w.exception()), None)
+                    state['done'].set()
+                    break
+                try:
+                    await asyncio.wait_for(state['done'].wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if error is not None:
+            raise error
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from table_io import write_table
+
+
+class CheckpointJournal:
+    """
+    Registre només d'afegir (write-ahead log) amb els anys trobats: una línia 'idx\\tyear\\tsource' per fila.
+    Les línies es sincronitzen a disc (fsync) per lots, de manera que el cost de cada
+    guardat depèn dels resultats nous i no de la mida del dataset.
+    """
+    def __init__(self, path='data/completed_dataset.journal', sync_every=50, sync_interval=5):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._discard_torn_tail()
+
+        self._file = open(path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def _discard_torn_tail(self):
+        # Una línia sense salt de línia final prové d'una escriptura interrompuda
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def append(self, idx, year, source):
+        self.append_many([(idx, year, source)])
+
+    def append_many(self, records):
+        # records: iterable de (idx, year, source)
+        lines = ''.join(f'{idx}\t{int(year)}\t{source or ""}\n' for idx, year, source in records if year)
+        if not lines:
+            return
+        with self._lock:
+            self._file.write(lines)
+            self._unsynced += lines.count('\n')
+            if self._unsynced >= self.sync_every or time.time() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def records(self):
+        """
+        Llegeix el registre i retorna {idx: (year, source)}; si una fila apareix més d'un cop, guanya l'última.
+        """
+        found = {}
+        if not os.path.exists(self.path):
+            return found
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    idx, year, source = line.rstrip('\n').split('\t')
+                    found[int(idx)] = (int(year), source or None)
+                except ValueError:
+                    continue
+        return found
+
+    def replay(self, df):
+        """
+        Aplica el registre sobre el df base (mateixes files i índex) i retorna quantes files s'han omplert.
+        """
+        found = self.records()
+        missing = [idx for idx in found if idx not in df.index]
+        if missing:
+            raise ValueError(f"El registre {self.path} té {len(missing)} índexs que no són al dataset base")
+
+        if found:
+            df.loc[list(found), 'year'] = [year for year, _ in found.values()]
+        return len(found)
+
+    def compact(self, df, final_path):
+        """
+        Escriu el df complet a 'final_path' de forma atòmica (fitxer temporal + rename).
+        """
+        self.flush()
+        root, ext = os.path.splitext(final_path)
+        tmp_path = f'{root}.tmp{ext}'
+        write_table(df, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
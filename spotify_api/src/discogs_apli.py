@@ -1,8 +1,8 @@
-import time
 import requests
+from rate_controller import AdaptiveRateController, parse_retry_after
 
 class DiscogsClient:
-    def __init__(self, user_token=None):
+    def __init__(self, user_token=None, max_retries=3, controller=None):
         self.user_token = user_token
         self.base_url = "https://api.discogs.com"
         self.headers = {
@@ -11,26 +11,27 @@ class DiscogsClient:
         }
         self.rate_limit = 60
         self.requests_made = 0
-        self.reset_time = time.time() + 60
+        self.max_retries = max_retries
+        # 60 peticions per minut autenticades
+        self.controller = controller or AdaptiveRateController(rate=self.rate_limit / 60)
 
     def _check_rate_limit(self, response):
-        limit = int(response.headers.get('X-Discogs-Ratelimit', 60))
-        used = int(response.headers.get('X-Discogs-Ratelimit-Used', 0))
-        remaining = int(response.headers.get('X-Discogs-Ratelimit-Remaining', limit))
-        
-        now = time.time()
-        if now > self.reset_time:
-            self.reset_time = now + 60
-            self.requests_made = 0
-        
+        # Sense capçaleres de quota el ritme es recupera amb success() com als altres clients
+        headers = response.headers
+        if 'X-Discogs-Ratelimit-Remaining' not in headers and 'X-Discogs-Ratelimit-Used' not in headers:
+            return
+
+        limit = int(headers.get('X-Discogs-Ratelimit', self.rate_limit))
+        used = int(headers.get('X-Discogs-Ratelimit-Used', 0))
+        remaining = int(headers.get('X-Discogs-Ratelimit-Remaining', limit - used))
+
         self.requests_made = used
-        
-        if remaining <= 1:
-            wait = self.reset_time - now
-            if wait > 0:
-                time.sleep(wait)
+
+        # La quota restant es reparteix dins la finestra mòbil de 60 segons
+        self.controller.quota(remaining, 60)
 
     def search_release(self, artist, track_name, album_name):
+        # Llista de resultats (buida si no n'hi ha cap) o None si la cerca ha fallat
         params = {
             'artist': artist,
             'title': track_name,
@@ -39,18 +40,42 @@ class DiscogsClient:
             'per_page': 5,
         }
         url = f"{self.base_url}/database/search"
-        response = requests.get(url, headers=self.headers, params=params)
-        self._check_rate_limit(response)
 
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('results', [])
-        else:
-            print(f"Error a Discogs API: {response.status_code}")
-            return []
+        for _ in range(self.max_retries + 1):
+            self.controller.wait()
+            try:
+                response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            except requests.RequestException as e:
+                print(f"Error de connexió amb Discogs API: {e}")
+                self.controller.failure()
+                continue
+
+            self._check_rate_limit(response)
+
+            if response.status_code == 429:
+                self.controller.retry_after(parse_retry_after(response.headers.get('Retry-After'), 60))
+                continue
+            if response.status_code >= 500:
+                self.controller.failure()
+                continue
+
+            if response.status_code == 200:
+                self.controller.success()
+                data = response.json()
+                return data.get('results', [])
+            elif response.status_code == 404:
+                return []
+            else:
+                print(f"Error a Discogs API: {response.status_code}")
+                return None
+
+        print("Discogs API no disponible després de diversos intents")
+        return None
 
     def get_year(self, artists, track_name, album_name):
         results = self.search_release(artists, track_name, album_name)
+        if results is None:
+            return None
         for release in results:
             year = release.get("year")
             if year:
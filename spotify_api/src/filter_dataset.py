@@ -1,26 +1,100 @@
-import pandas as pd
+import numpy as np
 import sys
+from table_io import TableWriter, iter_table, read_table, write_table
 
-if __name__ == '__main__':
+# Columnes que fa servir el filtre, amb el tipus explícit per llegir-les per trossos
+FILTER_DTYPES = {
+    'duration_ms': 'int64',
+    'speechiness': 'float64',
+    'instrumentalness': 'float64',
+}
 
-    # Llegeix el dataset
-    df = pd.read_csv('data/dataset.csv')
 
-    # Càlcul dels quartils i IQR
-    Q1 = df['duration_ms'].quantile(0.25)
-    Q3 = df['duration_ms'].quantile(0.75)
+def iqr_bounds(values):
+    Q1 = values.quantile(0.25)
+    Q3 = values.quantile(0.75)
     IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
 
-    # Límits per definir outliers
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
 
-    df_filtered = df[
+def _quantile_from_counts(counts, q):
+    """
+    Quantil exacte (interpolació lineal, com pandas) a partir del recompte de cada valor.
+    """
+    values = counts.index.to_numpy(dtype='float64')
+    cumulative = np.cumsum(counts.to_numpy())
+    position = q * (cumulative[-1] - 1)
+    lower = int(np.floor(position))
+    upper = int(np.ceil(position))
+
+    v_lower = values[np.searchsorted(cumulative, lower, side='right')]
+    v_upper = values[np.searchsorted(cumulative, upper, side='right')]
+    # Mateixa aritmètica que numpy per obtenir exactament el mateix resultat
+    return np.quantile([v_lower, v_upper], position - lower)
+
+
+def streaming_iqr_bounds(input_path, chunksize=500_000):
+    """
+    Primera passada: només llegeix 'duration_ms' i en compta els valors diferents.
+    La memòria depèn del nombre de durades diferents, no del nombre de files.
+    """
+    counts = None
+    for chunk in iter_table(input_path, columns=['duration_ms'], dtype={'duration_ms': 'int64'}, chunksize=chunksize):
+        chunk_counts = chunk['duration_ms'].value_counts()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+
+    # Sense files (només capçalera): els mateixos límits NaN que iqr_bounds amb una sèrie buida
+    if counts is None or counts.empty:
+        return np.nan, np.nan
+
+    counts = counts.sort_index()
+    Q1 = _quantile_from_counts(counts, 0.25)
+    Q3 = _quantile_from_counts(counts, 0.75)
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+def filter_mask(df, lower_bound, upper_bound):
+    return (
         (df['duration_ms'] >= lower_bound) &
         (df['duration_ms'] <= upper_bound) &
         (df['speechiness'] < 0.66) &
         (df['instrumentalness'] < 0.9)
-    ]
+    )
+
+
+def filter_dataset(input_path, output_path):
+    # Llegeix el dataset
+    df = read_table(input_path)
+
+    # Límits per definir outliers
+    lower_bound, upper_bound = iqr_bounds(df['duration_ms'])
+
+    df_filtered = df[filter_mask(df, lower_bound, upper_bound)]
+
+    # Desa el nou DataFrame en format CSV o Parquet
+    write_table(df_filtered, output_path)
+
+
+def filter_dataset_streaming(input_path, output_path, chunksize=500_000):
+    """
+    Filtra per trossos en dues passades (límits IQR exactes i filtre), escrivint el resultat a mesura que avança.
+    """
+    lower_bound, upper_bound = streaming_iqr_bounds(input_path, chunksize)
+
+    with TableWriter(output_path) as writer:
+        for chunk in iter_table(input_path, dtype=FILTER_DTYPES, chunksize=chunksize):
+            writer.write(chunk[filter_mask(chunk, lower_bound, upper_bound)])
+
+
+if __name__ == '__main__':
+
+    # Amb --parquet el resultat es desa en format columnar (conserva els tipus i és més petit)
+    data_format = 'parquet' if '--parquet' in sys.argv else 'csv'
+    output_path = f'data/filtered_dataset.{data_format}'
 
-    # Desa el nou DataFrame en format CSV
-    df_filtered.to_csv('data/filtered_dataset.csv', index=False)
\ No newline at end of file
+    # Amb --stream el dataset es processa per trossos, sense carregar-lo sencer a memòria
+    if '--stream' in sys.argv:
+        filter_dataset_streaming('data/dataset.csv', output_path)
+    else:
+        filter_dataset('data/dataset.csv', output_path)
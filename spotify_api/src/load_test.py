@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from api_data_merger import APIDataMerger
+from async_enrichment import RateLimited
+from rate_controller import AdaptiveRateController, TokenBucket
+
+# Configuració per defecte de cada proveïdor simulat: latència lognormal (mediana i sigma, en
+# segons), límit del servidor (peticions per segon i ràfega), probabilitat de 429 espontani,
+# proporció de consultes que troben l'any, i ritme i concurrència del client
+DEFAULT_PROFILES = {
+    'spotify': {
+        'latency_median': 0.12, 'latency_sigma': 0.5, 'server_rate': 3.0, 'server_burst': 5,
+        'error_429_rate': 0.01, 'retry_after': 2, 'hit_ratio': 0.85, 'client_rate': 2.0, 'concurrency': 2,
+    },
+    'musicbrainz': {
+        'latency_median': 0.3, 'latency_sigma': 0.6, 'server_rate': 1.0, 'server_burst': 1,
+        'error_429_rate': 0.02, 'retry_after': 1, 'hit_ratio': 0.6, 'client_rate': 1.0, 'concurrency': 1,
+    },
+    'discogs': {
+        'latency_median': 0.25, 'latency_sigma': 0.5, 'server_rate': 1.0, 'server_burst': 60,
+        'error_429_rate': 0.0, 'retry_after': 60, 'hit_ratio': 0.7, 'client_rate': 1.0, 'concurrency': 1,
+    },
+}
+
+
+class SimulatedServer:
+    """
+    API simulada: límit de peticions al costat del servidor, latència aleatòria, 429 espontanis
+    i una proporció configurable de consultes trobades. Tots els temps es divideixen per 'speedup'.
+    """
+    def __init__(self, name, latency_median, latency_sigma, server_rate, server_burst, error_429_rate,
+                 retry_after, hit_ratio, speedup=1.0, seed=0, **_):
+        self.name = name
+        self.latency_median = latency_median / speedup
+        self.latency_sigma = latency_sigma
+        self.error_429_rate = error_429_rate
+        self.retry_after = retry_after / speedup
+        self.hit_ratio = hit_ratio
+        self.bucket = TokenBucket(server_rate * speedup, server_burst)
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # Estadístiques
+        self.requests = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.latencies = []
+
+    def handle(self, keys):
+        """
+        Resol una petició per a 'keys'. Retorna (latència, {clau: any}) o llança RateLimited.
+        """
+        with self._lock:
+            self.requests += 1
+            # Sense quota el servidor indica quan n'hi tornarà a haver; els 429 espontanis, 'retry_after'
+            if not self.bucket.try_acquire():
+                self.rejected += 1
+                raise RateLimited(self.bucket.delay())
+            if self.rng.random() < self.error_429_rate:
+                self.rejected += 1
+                raise RateLimited(self.retry_after)
+            self.accepted += 1
+
+            latency = self.rng.lognormvariate(np.log(self.latency_median), self.latency_sigma)
+            years = {
+                key: self.rng.randint(1950, 2023) if self.rng.random() < self.hit_ratio else 0
+                for key in keys
+            }
+        return latency, years
+
+    def record(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def stats(self, elapsed):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        capacity = self.bucket.rate * elapsed + self.bucket.capacity
+        return {
+            'requests': self.requests,
+            'accepted': self.accepted,
+            'rate_limited': self.rejected,
+            'quota_utilisation': round(self.accepted / capacity, 3) if capacity else None,
+            'latency_p50': round(float(np.percentile(latencies, 50)), 4),
+            'latency_p95': round(float(np.percentile(latencies, 95)), 4),
+            'latency_p99': round(float(np.percentile(latencies, 99)), 4),
+            'latency_max': round(float(latencies.max()), 4),
+        }
+
+
+class _SimulatedClient:
+    # Part comuna dels clients síncrons: ritme amb el controlador, reintents i latència
+    def __init__(self, server, controller, max_retries=3):
+        self.server = server
+        self.controller = controller
+        self.max_retries = max_retries
+
+    def _request(self, keys):
+        for _ in range(self.max_retries + 1):
+            self.controller.wait()
+            # La latència es mesura per petició, sense les esperes del controlador (com a l'async)
+            start = time.monotonic()
+            try:
+                latency, years = self.server.handle(keys)
+            except RateLimited as e:
+                self.server.record(time.monotonic() - start)
+                self.controller.retry_after(e.retry_after)
+                continue
+            time.sleep(latency)
+            self.server.record(time.monotonic() - start)
+            self.controller.success()
+            return years
+        # Com els clients reals: una consulta fallida és None, no un resultat negatiu
+        return {key: None for key in keys}
+
+
+class SimulatedSpotipyClient(_SimulatedClient):
+    # Mateixa interfície que SpotipyClient
+    batch_size = 50
+
+    def get_year(self, track_id):
+        return self._request([track_id])[track_id]
+
+    def get_years(self, track_ids):
+        unique_ids = list(dict.fromkeys(track_ids))
+        years = {}
+        for start in range(0, len(unique_ids), self.batch_size):
+            years.update(self._request(unique_ids[start:start + self.batch_size]))
+        return years
+
+
+class SimulatedMetadataClient(_SimulatedClient):
+    # Mateixa interfície que MusicBrainzClient i DiscogsClient
+    def get_year(self, artists, track_name, album_name):
+        key = (artists, track_name, album_name)
+        return self._request([key])[key]
+
+
+class SimulatedAsyncProvider:
+    # Mateixa interfície que els proveïdors d'async_enrichment (la sessió HTTP no es fa servir)
+    def __init__(self, server, rate, concurrency=1):
+        self.name = server.name
+        self.server = server
+        self.limiter = AdaptiveRateController(rate)
+        self.concurrency = concurrency
+
+    async def get_year(self, session, row):
+        start = time.monotonic()
+        try:
+            latency, years = self.server.handle([row])
+            await asyncio.sleep(latency)
+            return years[row]
+        finally:
+            self.server.record(time.monotonic() - start)
+
+
+def synthetic_rows(n_rows, duplicates=0.1, seed=0):
+    # Files pendents amb les columnes que fa servir APIDataMerger ('duplicates': track_id repetits)
+    rng = np.random.default_rng(seed)
+    n_tracks = max(1, int(n_rows * (1 - duplicates)))
+    track_ids = rng.integers(0, n_tracks, n_rows) if duplicates else np.arange(n_rows)
+    return pd.DataFrame({
+        'track_id': [f'track_{i}' for i in track_ids],
+        'artists': [f'artist_{i % 997}' for i in track_ids],
+        'track_name': [f'song_{i}' for i in track_ids],
+        'album_name': [f'album_{i % 4001}' for i in track_ids],
+        'year': pd.array([None] * n_rows, dtype='Int64'),
+    })
+
+
+def run_load_test(n_rows=500, mode='async', profiles=None, speedup=1.0, seed=0, duplicates=0.1):
+    """
+    Executa APIDataMerger contra els proveïdors simulats i retorna les mètriques de l'execució:
+    files per segon, utilització de la quota, temps d'espera del client i latències de cada proveïdor.
+    'mode' és 'async', 'threads' o 'threads_batch' (Spotify per lots de 50).
+    """
+    profiles = {name: {**DEFAULT_PROFILES[name], **(profiles or {}).get(name, {})} for name in DEFAULT_PROFILES}
+    servers = {
+        name: SimulatedServer(name, speedup=speedup, seed=seed + i, **profile)
+        for i, (name, profile) in enumerate(profiles.items())
+    }
+
+    df = synthetic_rows(n_rows, duplicates, seed)
+    merger = APIDataMerger(df, 'client_id', 'client_secret', 'token')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_path = os.path.join(tmp_dir, 'completed.csv')
+        final_path = os.path.join(tmp_dir, 'final.csv')
+
+        start = time.monotonic()
+        if mode == 'async':
+            providers = [
+                SimulatedAsyncProvider(servers[name], profiles[name]['client_rate'] * speedup,
+                                       profiles[name]['concurrency'])
+                for name in profiles
+            ]
+            merger.complete_dataset_async(save_path, providers=providers, final_path=final_path)
+            controllers = {p.name: p.limiter for p in providers}
+        else:
+            controllers = {name: AdaptiveRateController(profiles[name]['client_rate'] * speedup) for name in profiles}
+            clients = (
+                SimulatedSpotipyClient(servers['spotify'], controllers['spotify']),
+                SimulatedMetadataClient(servers['musicbrainz'], controllers['musicbrainz']),
+                SimulatedMetadataClient(servers['discogs'], controllers['discogs']),
+            )
+            merger.complete_dataset(save_path, spotify_batch=(mode == 'threads_batch'), final_path=final_path,
+                                    clients=clients)
+        elapsed = time.monotonic() - start
+
+    resolved = int(df['year'].notna().sum())
+    providers = {}
+    for name, server in servers.items():
+        stats = server.stats(elapsed)
+        stats['client_sleep_seconds'] = round(controllers[name].waited, 3)
+        stats['client_rate'] = round(controllers[name].rate, 3)
+        providers[name] = stats
+
+    return {
+        'mode': mode,
+        'rows': n_rows,
+        'speedup': speedup,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(n_rows / elapsed, 2),
+        'resolved': resolved,
+        'providers': providers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova de càrrega d'APIDataMerger amb proveïdors simulats")
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--mode', choices=['async', 'threads', 'threads_batch'], default='async')
+    parser.add_argument('--speedup', type=float, default=10.0,
+                        help="Factor que accelera latències, límits i esperes (1 = temps real)")
+    parser.add_argument('--duplicates', type=float, default=0.1, help="Proporció de track_id repetits")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profiles', help="JSON amb canvis als perfils, p. ex. '{\"spotify\": {\"hit_ratio\": 0.5}}'")
+    parser.add_argument('--output', help="Fitxer JSON on desar les mètriques")
+    args = parser.parse_args()
+
+    result = run_load_test(
+        n_rows=args.rows,
+        mode=args.mode,
+        profiles=json.loads(args.profiles) if args.profiles else None,
+        speedup=args.speedup,
+        seed=args.seed,
+        duplicates=args.duplicates,
+    )
+
+    print(f"\n{result['mode']}: {result['rows']} files en {result['elapsed_seconds']}s "
+          f"({result['rows_per_second']} files/s), {result['resolved']} amb any")
+    for name, stats in result['providers'].items():
+        print(f"📊 {name}: {stats}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({**result, 'params': vars(args)}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def _normalize(value):
+    value = unicodedata.normalize('NFKC', str(value)).lower().strip()
+    return re.sub(r'\s+', ' ', value)
+
+
+def track_key(track_id):
+    return f'track:{str(track_id).strip()}'
+
+
+def metadata_key(artists, track_name, album_name):
+    return 'meta:' + '|'.join(_normalize(v) for v in (artists, track_name, album_name))
+
+
+class YearLookupCache:
+    """
+    Cache persistent (SQLite) dels anys de publicació trobats per cada proveïdor.
+    Els resultats negatius (any no trobat) caduquen després de 'negative_ttl' segons.
+    """
+    def __init__(self, path='data/year_cache.sqlite', negative_ttl=7 * 24 * 3600):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS lookups ('
+            'key TEXT NOT NULL, source TEXT NOT NULL, year INTEGER, updated REAL NOT NULL, '
+            'PRIMARY KEY (key, source))'
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def put(self, key, source, year):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO lookups (key, source, year, updated) VALUES (?, ?, ?, ?)',
+                (key, source, int(year) if year else None, time.time())
+            )
+            self._conn.commit()
+
+    def put_many(self, entries):
+        # entries: iterable de (key, source, year)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO lookups (key, source, year, updated) VALUES (?, ?, ?, ?)',
+                [(key, source, int(year) if year else None, now) for key, source, year in entries]
+            )
+            self._conn.commit()
+
+    def lookup_many(self, keys):
+        """
+        Retorna {key: {'year': any o None, 'negative': proveïdors amb resultat negatiu vigent}}
+        només per a les claus que tenen alguna entrada vàlida.
+        """
+        keys = list(dict.fromkeys(keys))
+        expiry = time.time() - self.negative_ttl
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, source, year, updated FROM lookups WHERE key IN ({placeholders})',
+                    chunk
+                ).fetchall()
+
+                for key, source, year, updated in rows:
+                    entry = found.setdefault(key, {'year': None, 'negative': set()})
+                    if year:
+                        entry['year'] = year
+                    elif updated >= expiry:
+                        entry['negative'].add(source)
+
+        return {k: v for k, v in found.items() if v['year'] or v['negative']}
+
+    def resolve(self, keys):
+        # Combina les entrades de diverses claus d'una mateixa fila
+        year = None
+        negative = set()
+        for entry in self.lookup_many(keys).values():
+            year = year or entry['year']
+            negative |= entry['negative']
+        return year, negative
+
+
+class CachedSpotifyClient:
+    # Consulta la cache abans de cridar SpotipyClient. Només es desen les respostes reals:
+    # un None del client (consulta fallida) no es guarda com a resultat negatiu
+    source = 'spotify'
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.batch_size = client.batch_size
+
+    def get_year(self, track_id):
+        year, negative = self.cache.resolve([track_key(track_id)])
+        if year or self.source in negative:
+            return year or 0
+        year = self.client.get_year(track_id)
+        if year is not None:
+            self.cache.put(track_key(track_id), self.source, year)
+        return year
+
+    def get_years(self, track_ids):
+        years = {}
+        missing = []
+        cached = self.cache.lookup_many([track_key(t) for t in track_ids])
+        for track_id in dict.fromkeys(track_ids):
+            entry = cached.get(track_key(track_id))
+            if entry and (entry['year'] or self.source in entry['negative']):
+                years[track_id] = entry['year'] or 0
+            else:
+                missing.append(track_id)
+
+        if missing:
+            fetched = self.client.get_years(missing)
+            self.cache.put_many((track_key(t), self.source, y) for t, y in fetched.items() if y is not None)
+            years.update(fetched)
+        return years
+
+
+class CachedMetadataClient:
+    # Consulta la cache abans de cridar MusicBrainzClient o DiscogsClient
+    def __init__(self, client, cache, source):
+        self.client = client
+        self.cache = cache
+        self.source = source
+
+    def get_year(self, artists, track_name, album_name):
+        key = metadata_key(artists, track_name, album_name)
+        year, negative = self.cache.resolve([key])
+        if year or self.source in negative:
+            return year or 0
+        year = self.client.get_year(artists, track_name, album_name)
+        if year is not None:
+            self.cache.put(key, self.source, year)
+        return year
@@ -1,6 +1,8 @@
 import os
-import pandas as pd
 from api_data_merger import APIDataMerger
+from checkpoint_journal import CheckpointJournal
+from lookup_cache import YearLookupCache
+from table_io import read_table
 
 
 if __name__ == '__main__':
@@ -10,15 +12,29 @@ if __name__ == '__main__':
 
     discogs_token = 'discogs_token'
 
-    save_path = 'data/completed_dataset.csv'
+    # Format dels fitxers de dades: 'csv' o 'parquet' (columnar, conserva els tipus)
+    data_format = 'csv'
+
+    save_path = f'data/completed_dataset.{data_format}'
 
     if os.path.exists(save_path):
-        df = pd.read_csv(save_path)
+        df = read_table(save_path)
         print(f'Recuperat progrés des de {save_path}')
     else:
-        df = pd.read_csv('data/filtered_dataset.csv')
+        df = read_table(f'data/filtered_dataset.{data_format}')
         df['year'] = None
         print('Arxiu carregat')
 
-    adm = APIDataMerger(df, spotify_client_id, spotify_client_secret, discogs_token)
-    adm.complete_dataset(save_path)
\ No newline at end of file
+    # El progrés es guarda com a registre d'anys trobats i es reaplica sobre l'arxiu base
+    journal = CheckpointJournal('data/completed_dataset.journal')
+    replayed = journal.replay(df)
+    if replayed:
+        print(f'Recuperats {replayed} anys des de {journal.path}')
+
+    # Els anys ja consultats (i els no trobats) es guarden entre execucions
+    lookup_cache = YearLookupCache('data/year_cache.sqlite')
+
+    adm = APIDataMerger(df, spotify_client_id, spotify_client_secret, discogs_token, lookup_cache=lookup_cache,
+                        journal=journal)
+    adm.complete_dataset_async(save_path, final_path=f'data/df_filtered_final.{data_format}')
+    journal.close()
\ No newline at end of file
@@ -1,31 +1,50 @@
 import musicbrainzngs
 
 import musicbrainzngs
-import time
+from rate_controller import AdaptiveRateController, parse_retry_after
 
 class MusicBrainzClient:
-    def __init__(self, rate_limit=1.0):
-        self.rate_limit = rate_limit
+    def __init__(self, rate_limit=1.0, max_retries=3, controller=None):
+        self.rate_limit = rate_limit  # segons entre peticions
+        self.max_retries = max_retries
         musicbrainzngs.set_useragent(
             "MusicEmotionProject", "1.0", "teu@email.com"
         )
-        self.last_call = 0
+        # El ritme el porta el controlador; desactivem l'espera interna de musicbrainzngs
+        musicbrainzngs.set_rate_limit(False)
+        self.controller = controller or AdaptiveRateController(rate=1 / rate_limit)
 
-    def _respect_rate_limit(self):
-        elapsed = time.time() - self.last_call
-        if elapsed < self.rate_limit:
-            time.sleep(self.rate_limit - elapsed)
-        self.last_call = time.time()
+    def _search(self, artist, track_name, album_name):
+        for _ in range(self.max_retries + 1):
+            self.controller.wait()
+            try:
+                result = musicbrainzngs.search_recordings(
+                    recording=track_name,
+                    artist=artist,
+                    release=album_name,
+                    limit=3
+                )
+            except musicbrainzngs.ResponseError as e:
+                # MusicBrainz respon 503 quan se supera el límit
+                cause = getattr(e, 'cause', None)
+                if getattr(cause, 'code', None) in (429, 503):
+                    headers = getattr(cause, 'headers', None) or {}
+                    self.controller.retry_after(parse_retry_after(headers.get('Retry-After'), 1))
+                    continue
+                raise
+            except musicbrainzngs.NetworkError:
+                self.controller.failure()
+                continue
+
+            self.controller.success()
+            return result
+
+        raise musicbrainzngs.NetworkError(f"MusicBrainz no disponible després de {self.max_retries + 1} intents")
 
     def get_year(self, artist, track_name, album_name):
-        self._respect_rate_limit()
+        # 0 si MusicBrainz no troba l'any; None si la cerca ha fallat i cal tornar-la a provar
         try:
-            result = musicbrainzngs.search_recordings(
-                recording=track_name,
-                artist=artist,
-                release=album_name,
-                limit=3
-            )
+            result = self._search(artist, track_name, album_name)
             recordings = result.get('recording-list', [])
 
             for recording in recordings:
@@ -43,4 +62,4 @@ class MusicBrainzClient:
             return 0
         except Exception as e:
             print(f'Error cercant {track_name} de {artist}: {e}')
-            return 0
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -0,0 +1,174 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de peticions: 'rate' peticions per segon amb ràfegues de fins a 'capacity'.
+    """
+    def __init__(self, rate, capacity=1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def available(self):
+        now = self._refill()
+        if now < self.blocked_until:
+            return 0
+        return self.tokens
+
+    def delay(self):
+        # Segons que cal esperar fins a tenir un token disponible
+        now = self._refill()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+    def release(self):
+        # Retorna un token que no s'ha fet servir
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds):
+        # Atura el proveïdor (per exemple després d'un 429 amb Retry-After)
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+        self.tokens = 0
+
+
+def parse_retry_after(value, default):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class AdaptiveRateController(TokenBucket):
+    """
+    TokenBucket que ajusta el ritme amb la resposta del proveïdor: reparteix la quota restant
+    (capçaleres de tipus 'remaining') dins la finestra, respecta Retry-After, redueix el ritme
+    a la meitat després d'un 429 i el recupera poc a poc amb les respostes correctes
+    (excepte si la mateixa resposta ja ha fixat el ritme amb la quota).
+    Els errors s'espaien amb backoff exponencial amb jitter.
+    """
+    def __init__(self, rate, capacity=1, min_rate=None, backoff_base=1.0, backoff_max=60.0, jitter=0.5,
+                 clock=time.monotonic, sleep=time.sleep, rng=None):
+        super().__init__(rate, capacity, clock)
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._consecutive_errors = 0
+        # La darrera resposta ha fixat el ritme amb la quota: success() no l'ha d'augmentar
+        self._quota_applied = False
+
+        # Estadístiques
+        self.requests = 0
+        self.waited = 0.0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def try_acquire(self):
+        if super().try_acquire():
+            self.requests += 1
+            return True
+        return False
+
+    def release(self):
+        super().release()
+        self.requests -= 1
+
+    async def acquire(self):
+        while not self.try_acquire():
+            delay = self.delay()
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def wait(self):
+        # Versió bloquejant d'acquire per als clients síncrons
+        while True:
+            with self._lock:
+                if self.try_acquire():
+                    return
+                delay = self.delay()
+            self.waited += delay
+            self.sleep(delay)
+
+    def quota(self, remaining, window):
+        """
+        Ajusta el ritme perquè les 'remaining' peticions restants es reparteixin en 'window' segons.
+        """
+        with self._lock:
+            if remaining is None or not window:
+                return
+            # Els tokens acumulats fins ara es compten amb el ritme anterior
+            self._refill()
+            self._quota_applied = True
+            if remaining <= 0:
+                self.block(window)
+                return
+            # La quota és el límit real del servidor: pot quedar per sota de 'min_rate'
+            self.rate = min(self.max_rate, remaining / window)
+
+    def retry_after(self, seconds):
+        with self._lock:
+            self._refill()
+            self.rate_limited += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.block(seconds)
+
+    def success(self):
+        with self._lock:
+            self._consecutive_errors = 0
+            if self._quota_applied:
+                self._quota_applied = False
+                return
+            # Recuperació additiva cap al ritme configurat
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def failure(self):
+        """
+        Registra un error i bloqueja el controlador un temps exponencial amb jitter. Retorna l'espera.
+        """
+        with self._lock:
+            self.errors += 1
+            self._consecutive_errors += 1
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_errors - 1))
+            delay = backoff * (1 - self.jitter * self.rng.random())
+            self.block(delay)
+            return delay
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'waited': round(self.waited, 3),
+            'rate_limited': self.rate_limited,
+            'errors': self.errors,
+            'rate': self.rate,
+        }
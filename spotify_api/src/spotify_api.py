@@ -1,14 +1,17 @@
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-import time
 import logging
+from rate_controller import AdaptiveRateController, parse_retry_after
 
 logging.basicConfig(level=logging.ERROR)
 logging.getLogger("spotipy").setLevel(logging.ERROR)
 logging.getLogger("spotipy").setLevel(logging.CRITICAL)
 
 class SpotipyClient:
-    def __init__(self, client_id, client_secret, max_retries=3, rate_limit=1.0):
+    # Màxim d'ids per petició a l'endpoint de tracks de l'API
+    batch_size = 50
+
+    def __init__(self, client_id, client_secret, max_retries=3, rate_limit=1.0, controller=None):
         self.auth_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
         self.sp = spotipy.Spotify(
             auth_manager=self.auth_manager,
@@ -19,25 +22,97 @@ class SpotipyClient:
         )
         self.max_retries = max_retries
         self.rate_limit = rate_limit  # segons entre peticions
-        self._last_request_time = 0
+        self.controller = controller or AdaptiveRateController(rate=1 / rate_limit)
+
+    def _rate_limited(self, e):
+        # Spotify indica als 429 quants segons cal esperar
+        retry_after = (e.headers or {}).get('Retry-After')
+        self.controller.retry_after(parse_retry_after(retry_after, 5))
 
     def get_year(self, track_id):
-        elapsed = time.time() - self._last_request_time
-        if elapsed < self.rate_limit:
-            time.sleep(self.rate_limit - elapsed)
-
-        try:
-            track = self.sp.track(track_id)
-            self._last_request_time = time.time()
-            release_date = track['album']['release_date']
-            if release_date:
-                return int(release_date.split('-')[0])
-        except spotipy.exceptions.SpotifyException as e:
-            if e.http_status == 429:
-                time.sleep(5)
-            else:
+        """
+        Retorna l'any del track, 0 si Spotify no el troba o None si la consulta ha fallat
+        (429 persistent, errors del servidor o de xarxa) i cal tornar-la a provar més endavant.
+        """
+        for _ in range(self.max_retries + 1):
+            self.controller.wait()
+            try:
+                track = self.sp.track(track_id)
+            except spotipy.exceptions.SpotifyException as e:
+                if e.http_status == 429:
+                    self._rate_limited(e)
+                    continue
+                if e.http_status >= 500:
+                    self.controller.failure()
+                    continue
+                if e.http_status in (400, 404):
+                    # Id invàlid o inexistent: és un resultat negatiu real
+                    return 0
                 print(f"Error inesperat amb el track {track_id}: {e}")
+                return None
+            except Exception as e:
+                print(f"Error desconegut amb el track {track_id}: {e}")
+                self.controller.failure()
+                return None
+
+            self.controller.success()
+            return self._year_from_track(track)
+
+        print(f"Rate limit persistent amb el track {track_id}")
+        return None
+
+    def _year_from_track(self, track):
+        if not track:
             return 0
-        except Exception as e:
-            print(f"Error desconegut amb el track {track_id}: {e}")
-            return 0
\ No newline at end of file
+        release_date = (track.get('album') or {}).get('release_date')
+        if release_date:
+            return int(release_date.split('-')[0])
+        return 0
+
+    def _get_years_chunk(self, chunk):
+        for _ in range(self.max_retries + 1):
+            self.controller.wait()
+            try:
+                response = self.sp.tracks(chunk)
+            except spotipy.exceptions.SpotifyException as e:
+                if e.http_status == 429:
+                    self._rate_limited(e)
+                    continue
+                if e.http_status >= 500:
+                    self.controller.failure()
+                    continue
+                if e.http_status == 400 and len(chunk) > 1:
+                    # Un id invàlid fa fallar tot el lot: el partim per aïllar-lo
+                    mid = len(chunk) // 2
+                    return {**self._get_years_chunk(chunk[:mid]), **self._get_years_chunk(chunk[mid:])}
+                if e.http_status in (400, 404):
+                    return {track_id: 0 for track_id in chunk}
+                print(f"Error inesperat amb el lot de {len(chunk)} tracks: {e}")
+                return {track_id: None for track_id in chunk}
+            except Exception as e:
+                print(f"Error desconegut amb el lot de {len(chunk)} tracks: {e}")
+                self.controller.failure()
+                return {track_id: None for track_id in chunk}
+
+            self.controller.success()
+
+            # Els tracks inexistents arriben com a None dins la llista
+            tracks = response.get('tracks', []) if response else []
+            years = {track_id: self._year_from_track(track) for track_id, track in zip(chunk, tracks)}
+            for track_id in chunk:
+                years.setdefault(track_id, 0)
+            return years
+
+        print(f"Rate limit persistent amb el lot de {len(chunk)} tracks")
+        return {track_id: None for track_id in chunk}
+
+    def get_years(self, track_ids):
+        """
+        Retorna {track_id: any} fent una petició per cada 50 ids (0 si no s'ha trobat,
+        None si la consulta del seu lot ha fallat).
+        """
+        unique_ids = list(dict.fromkeys(track_ids))
+        years = {}
+        for start in range(0, len(unique_ids), self.batch_size):
+            years.update(self._get_years_chunk(unique_ids[start:start + self.batch_size]))
+        return years
@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Reexporta spotify_common/table_io.py, l'única implementació (compartida amb visualització_spotify)
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from spotify_common.table_io import (  # noqa: E402,F401
+    CATEGORICAL_COLUMNS,
+    NULLABLE_INT_COLUMNS,
+    TableWriter,
+    is_columnar,
+    iter_table,
+    read_table,
+    write_table,
+)
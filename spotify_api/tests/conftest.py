@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Els mòduls de spotify_api/src s'importen pel nom, com quan s'executa main.py des de src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
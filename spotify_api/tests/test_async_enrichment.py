@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from async_enrichment import AsyncMusicBrainzProvider, AsyncSpotifyProvider, EnrichmentEngine
+
+
+class StubApi:
+    """
+    Servidor HTTP local amb les rutes que fan servir els proveïdors. 'tracks' són les respostes
+    de Spotify per id, en ordre: cada element és (status, cos JSON, capçaleres).
+    """
+    def __init__(self, tracks=None, recordings=None):
+        self.tracks = {track_id: list(responses) for track_id, responses in (tracks or {}).items()}
+        self.recordings = recordings or []
+        self.requests = []
+
+    async def token(self, request):
+        return web.json_response({'access_token': 'token', 'expires_in': 3600})
+
+    async def track(self, request):
+        track_id = request.match_info['track_id']
+        self.requests.append(('spotify', track_id))
+        status, body, headers = self.tracks[track_id].pop(0)
+        return web.json_response(body, status=status, headers=headers)
+
+    async def recording(self, request):
+        self.requests.append(('musicbrainz', request.query['query']))
+        return web.json_response({'recordings': self.recordings})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/token', self.token)
+        app.router.add_get('/v1/tracks/{track_id}', self.track)
+        app.router.add_get('/ws/2/recording', self.recording)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def spotify(self, **kwargs):
+        return AsyncSpotifyProvider('client_id', 'client_secret', rate=100, api_url=f'{self.url}/v1',
+                                    accounts_url=f'{self.url}/token', **kwargs)
+
+    def musicbrainz(self, **kwargs):
+        return AsyncMusicBrainzProvider(rate=100, api_url=f'{self.url}/ws/2', **kwargs)
+
+
+def run_engine(api, providers_fn, rows, on_result=None, on_miss=None, timeout=10):
+    # Arrenca el servidor, executa el motor i retorna {idx: (any, font)}; 'timeout' detecta bloquejos
+    results = {}
+
+    async def main():
+        await api.start()
+        try:
+            engine = EnrichmentEngine(providers_fn(api))
+            callback = on_result or (lambda idx, year, source: results.__setitem__(idx, (year, source)))
+            await asyncio.wait_for(engine.run(rows, callback, on_miss=on_miss), timeout)
+            return engine
+        finally:
+            await api.stop()
+
+    engine = asyncio.run(main())
+    return results, engine
+
+
+def album(date):
+    return {'album': {'release_date': date}}
+
+
+def test_rate_limited_request_is_retried_after_retry_after():
+    api = StubApi(tracks={'t1': [
+        (429, {}, {'Retry-After': '0.2'}),
+        (200, album('1994-05-01'), {}),
+    ]})
+
+    results, engine = run_engine(api, lambda api: [api.spotify()], [(0, 't1', 'artist', 'song', 'album')])
+
+    assert results == {0: (1994, 'spotify')}
+    assert api.requests == [('spotify', 't1'), ('spotify', 't1')]
+    assert engine.stats()['spotify']['rate_limited'] == 1
+
+
+def test_miss_falls_back_to_next_provider():
+    api = StubApi(
+        tracks={'t1': [(200, album(None), {})]},
+        recordings=[{'releases': [{'date': '1987-02-03'}]}],
+    )
+
+    def providers(api):
+        spotify, musicbrainz = api.spotify(), api.musicbrainz()
+        # MusicBrainz comença aturat perquè Spotify agafi la fila primer
+        musicbrainz.limiter.block(0.3)
+        return [spotify, musicbrainz]
+
+    misses = []
+    results, _ = run_engine(api, providers, [(0, 't1', 'artist', 'song', 'album')],
+                            on_miss=lambda idx, source: misses.append((idx, source)))
+
+    assert results == {0: (1987, 'musicbrainz')}
+    assert misses == [(0, 'spotify')]
+    assert [source for source, _ in api.requests] == ['spotify', 'musicbrainz']
+
+
+def test_unexpected_payload_counts_as_failed_row():
+    # "album": null fa fallar la lectura de la resposta: la fila es dona per fallada i run() acaba
+    api = StubApi(tracks={'t1': [(200, {'album': None}, {})], 't2': [(200, album('2001'), {})]})
+
+    results, engine = run_engine(api, lambda api: [api.spotify()], [
+        (0, 't1', 'artist', 'song', 'album'),
+        (1, 't2', 'artist', 'song', 'album'),
+    ])
+
+    assert results == {0: (None, None), 1: (2001, 'spotify')}
+    assert engine.stats()['spotify']['errors'] == 1
+
+
+def test_worker_crash_is_propagated_by_run():
+    api = StubApi(tracks={'t1': [(200, album('1999'), {})]})
+
+    def on_result(idx, year, source):
+        raise OSError('disk full')
+
+    with pytest.raises(OSError, match='disk full'):
+        run_engine(api, lambda api: [api.spotify()], [(0, 't1', 'artist', 'song', 'album')], on_result=on_result)
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from filter_dataset import filter_dataset, filter_dataset_streaming, iqr_bounds, streaming_iqr_bounds
+
+
+def write_csv(path, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'track_id': [f'track_{i}' for i in range(n_rows)],
+        'duration_ms': rng.integers(60_000, 400_000, n_rows),
+        'speechiness': rng.random(n_rows),
+        'instrumentalness': rng.random(n_rows),
+    }).to_csv(path, index=False)
+
+
+def test_streaming_bounds_match_in_memory_bounds(tmp_path):
+    path = tmp_path / 'input.csv'
+    write_csv(path, 1000)
+
+    assert streaming_iqr_bounds(str(path), chunksize=128) == iqr_bounds(pd.read_csv(path)['duration_ms'])
+
+
+def test_header_only_csv(tmp_path):
+    path = tmp_path / 'input.csv'
+    write_csv(path, 0)
+
+    lower, upper = streaming_iqr_bounds(str(path))
+    expected = iqr_bounds(pd.read_csv(path)['duration_ms'])
+    assert np.isnan(lower) and np.isnan(upper)
+    assert np.isnan(expected[0]) and np.isnan(expected[1])
+
+    filter_dataset(str(path), str(tmp_path / 'filtered.csv'))
+    filter_dataset_streaming(str(path), str(tmp_path / 'streamed.csv'))
+    assert len(pd.read_csv(tmp_path / 'streamed.csv')) == len(pd.read_csv(tmp_path / 'filtered.csv')) == 0
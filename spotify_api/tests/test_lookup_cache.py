@@ -0,0 +1,62 @@
+from lookup_cache import CachedMetadataClient, CachedSpotifyClient, YearLookupCache, metadata_key, track_key
+
+
+class StubSpotify:
+    # Retorna els anys de 'years' (None = consulta fallida) i compta les consultes
+    batch_size = 50
+
+    def __init__(self, years):
+        self.years = years
+        self.calls = 0
+
+    def get_year(self, track_id):
+        self.calls += 1
+        return self.years[track_id]
+
+    def get_years(self, track_ids):
+        self.calls += 1
+        return {t: self.years[t] for t in track_ids}
+
+
+class StubMetadata:
+    def __init__(self, year):
+        self.year = year
+        self.calls = 0
+
+    def get_year(self, artists, track_name, album_name):
+        self.calls += 1
+        return self.year
+
+
+def test_failures_are_not_cached_as_negative(tmp_path):
+    cache = YearLookupCache(str(tmp_path / 'cache.sqlite'))
+    client = StubSpotify({'found': 1999, 'missing': 0, 'failed': None})
+    cached = CachedSpotifyClient(client, cache)
+
+    assert cached.get_years(['found', 'missing', 'failed']) == {'found': 1999, 'missing': 0, 'failed': None}
+
+    entries = cache.lookup_many([track_key(t) for t in ('found', 'missing', 'failed')])
+    assert entries[track_key('found')]['year'] == 1999
+    assert entries[track_key('missing')]['negative'] == {'spotify'}
+    assert track_key('failed') not in entries
+
+    # A la següent execució només es torna a consultar la que havia fallat
+    client.years['failed'] = 2005
+    assert cached.get_years(['found', 'missing', 'failed']) == {'found': 1999, 'missing': 0, 'failed': 2005}
+    assert client.calls == 2
+    cache.close()
+
+
+def test_metadata_failure_is_retried(tmp_path):
+    cache = YearLookupCache(str(tmp_path / 'cache.sqlite'))
+    client = StubMetadata(None)
+    cached = CachedMetadataClient(client, cache, 'musicbrainz')
+
+    assert cached.get_year('artist', 'song', 'album') is None
+    assert cache.lookup_many([metadata_key('artist', 'song', 'album')]) == {}
+
+    client.year = 0
+    assert cached.get_year('artist', 'song', 'album') == 0
+    assert cached.get_year('artist', 'song', 'album') == 0
+    assert client.calls == 2
+    cache.close()
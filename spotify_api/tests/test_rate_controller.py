@@ -0,0 +1,35 @@
+from rate_controller import AdaptiveRateController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_success_keeps_rate_set_by_quota():
+    controller = AdaptiveRateController(rate=1.0, clock=FakeClock())
+
+    # Una sola petició restant en una finestra de 60 s: el ritme ha de ser 1/60
+    controller.quota(1, 60)
+    controller.success()
+    assert controller.rate == 1 / 60
+
+    # Sense quota a la resposta, el ritme es recupera de manera additiva
+    controller.success()
+    assert controller.rate == 1 / 60 + 0.1
+
+
+def test_rate_changes_refill_tokens_at_previous_rate():
+    clock = FakeClock()
+    controller = AdaptiveRateController(rate=1.0, capacity=10, clock=clock)
+    controller.tokens = 0
+
+    clock.now = 4
+    controller.quota(6, 60)
+    assert controller.tokens == 4
+
+    clock.now = 14
+    assert controller.available() == 5
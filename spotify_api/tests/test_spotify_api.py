@@ -0,0 +1,163 @@
+import queue
+
+import pandas as pd
+import pytest
+from spotipy.exceptions import SpotifyException
+
+from api_data_merger import APIDataMerger
+from rate_controller import AdaptiveRateController
+from spotify_api import SpotipyClient
+
+
+class FakeClock:
+    # Rellotge i sleep simulats: les esperes del controlador avancen el temps sense dormir
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeSpotify:
+    """
+    Substitut de spotipy.Spotify per a sp.tracks: 'years' dona l'any de cada id conegut,
+    'invalid' són ids que fan fallar tot el lot amb un 400 i 'errors' són excepcions
+    que es llancen, per ordre, abans de respondre.
+    """
+    def __init__(self, years, invalid=(), errors=()):
+        self.years = years
+        self.invalid = set(invalid)
+        self.errors = list(errors)
+        self.calls = []
+
+    def tracks(self, track_ids):
+        self.calls.append(list(track_ids))
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.invalid & set(track_ids):
+            raise SpotifyException(400, -1, 'invalid id')
+        return {'tracks': [
+            {'id': t, 'album': {'release_date': f'{self.years[t]}-01-01'}} if t in self.years else None
+            for t in track_ids
+        ]}
+
+
+def make_client(fake, clock=None):
+    clock = clock or FakeClock()
+    controller = AdaptiveRateController(rate=1.0, clock=clock, sleep=clock.sleep)
+    client = SpotipyClient('client_id', 'client_secret', controller=controller)
+    client.sp = fake
+    return client
+
+
+def test_get_years_chunks_by_50_and_deduplicates():
+    ids = [f'id{i}' for i in range(120)]
+    fake = FakeSpotify({t: 1990 + i % 30 for i, t in enumerate(ids)})
+    client = make_client(fake)
+
+    years = client.get_years(ids + ids[:10])
+
+    assert [len(call) for call in fake.calls] == [50, 50, 20]
+    assert sum(fake.calls, []) == ids
+    assert years == {t: 1990 + i % 30 for i, t in enumerate(ids)}
+
+
+def test_get_years_unknown_ids_are_misses():
+    fake = FakeSpotify({'a': 2001, 'c': 1985})
+    client = make_client(fake)
+
+    assert client.get_years(['a', 'b', 'c']) == {'a': 2001, 'b': 0, 'c': 1985}
+
+
+def test_get_years_waits_retry_after_then_succeeds():
+    clock = FakeClock()
+    fake = FakeSpotify({'a': 2001}, errors=[SpotifyException(429, -1, 'rate limit', headers={'Retry-After': '7'})])
+    client = make_client(fake, clock)
+
+    assert client.get_years(['a']) == {'a': 2001}
+    assert len(fake.calls) == 2
+    assert client.controller.rate_limited == 1
+    assert sum(clock.slept) >= 7
+
+
+def test_get_years_bisects_bad_request_to_isolate_invalid_id():
+    ids = [f'id{i}' for i in range(8)]
+    fake = FakeSpotify({t: 2000 + i for i, t in enumerate(ids) if t != 'id5'}, invalid=['id5'])
+    client = make_client(fake)
+
+    years = client.get_years(ids)
+
+    assert years == {t: (0 if t == 'id5' else 2000 + i) for i, t in enumerate(ids)}
+    # El lot es parteix fins que l'id invàlid queda sol
+    assert ['id5'] in fake.calls
+    assert max(len(call) for call in fake.calls if 'id5' not in call) <= 4
+
+
+def test_get_years_failures_are_none_not_misses():
+    fake = FakeSpotify({'a': 2001}, errors=[SpotifyException(502, -1, 'bad gateway')] * 4)
+    client = make_client(fake)
+
+    assert client.get_years(['a', 'b']) == {'a': None, 'b': None}
+    assert client.get_years(['a', 'b']) == {'a': 2001, 'b': 0}
+
+
+class StubBatchClient:
+    batch_size = 50
+
+    def __init__(self, years):
+        self.years = years
+        self.calls = []
+
+    def get_years(self, track_ids):
+        self.calls.append(list(track_ids))
+        return {t: self.years.get(t, 0) for t in track_ids}
+
+
+def make_jobs(n):
+    return [(idx, f'id{idx}', f'artist{idx}', f'song{idx}', f'album{idx}') for idx in range(n)]
+
+
+def make_merger(n):
+    df = pd.DataFrame({'year': pd.array([None] * n, dtype='Int64')})
+    return APIDataMerger(df, 'client_id', 'client_secret', 'token')
+
+
+@pytest.mark.parametrize('with_fallback', [True, False])
+def test_batch_worker_writes_results_and_hands_misses_to_fallbacks(with_fallback):
+    jobs = make_jobs(60)
+    client = StubBatchClient({f'id{idx}': 1970 + idx for idx in range(60) if idx % 4})
+    merger = make_merger(60)
+
+    q = queue.Queue()
+    for job in jobs:
+        q.put(job)
+    q.put(None)
+    results = queue.Queue()
+    fallback_queues = (queue.Queue(), queue.Queue()) if with_fallback else ()
+
+    merger._worker_spotify_batch(client, q, results, fallback_queues)
+
+    # Una petició per cada 50 files de la cua
+    assert [len(call) for call in client.calls] == [50, 10]
+
+    written = []
+    while not results.empty():
+        written.extend(results.get_nowait())
+    found = {idx: year for idx, year, source in written if year}
+    assert found == {idx: 1970 + idx for idx in range(60) if idx % 4}
+    assert all(source == 'spotify' for _, _, source in written)
+
+    misses = [job for job in jobs if job[0] % 4 == 0]
+    if with_fallback:
+        handed = [fq.get_nowait() for fq in fallback_queues for _ in range(fq.qsize())]
+        assert sorted(handed) == misses
+        assert all(fq.qsize() == 0 for fq in fallback_queues)
+        assert not [idx for idx, year, _ in written if not year]
+    else:
+        assert sorted(idx for idx, year, _ in written if not year) == [job[0] for job in misses]
+    assert q.unfinished_tasks == 0
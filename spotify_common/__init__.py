@@ -0,0 +1 @@
+# Codi compartit entre spotify_api i visualització_spotify
@@ -0,0 +1,97 @@
+# Lectura i escriptura de taules en CSV o Parquet, compartida per spotify_api i visualització_spotify.
+# Aquesta és l'única implementació: els table_io.py de cada src només la reexporten.
+import os
+import pandas as pd
+
+# Columnes de text amb pocs valors diferents: en format columnar es guarden com a categories
+CATEGORICAL_COLUMNS = ('track_genre', 'genre_group', 'genre_cluster')
+
+# Columnes enteres que poden tenir nuls (en CSV acaben com a float o object)
+NULLABLE_INT_COLUMNS = ('year', 'decade')
+
+
+def is_columnar(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def _encode(df):
+    """
+    Tipus que es conserven en format Parquet: categories i enters amb nuls.
+    """
+    df = df.copy(deep=False)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in NULLABLE_INT_COLUMNS:
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col]).round().astype('Int64')
+    return df
+
+
+def read_table(path, columns=None):
+    """
+    Llegeix un CSV o un Parquet (segons l'extensió). Amb 'columns' només es llegeixen aquestes columnes.
+    """
+    if is_columnar(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_table(path, columns=None, dtype=None, chunksize=500_000):
+    # Llegeix el fitxer per trossos de 'chunksize' files
+    if is_columnar(path):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            yield chunk.astype(dtype) if dtype else chunk
+    else:
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunksize)
+
+
+def write_table(df, path):
+    """
+    Desa el df com a CSV o Parquet (segons l'extensió). El Parquet s'escriu a un temporal i es reanomena.
+    """
+    if is_columnar(path):
+        tmp_path = f'{path}.tmp'
+        _encode(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    else:
+        df.to_csv(path, index=False)
+
+
+class TableWriter:
+    """
+    Escriu un CSV o un Parquet tros a tros, sense tenir tot el resultat a memòria.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        if not is_columnar(self.path):
+            df.to_csv(self.path, index=False, header=self._header, mode='w' if self._header else 'a')
+            self._header = False
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(_encode(df), preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(table.cast(self._schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
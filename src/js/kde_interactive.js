@@ -1,8 +1,8 @@
 document.addEventListener('DOMContentLoaded', () => {
   const baseLayers = [
-    { id: 'decoration', src: 'img/1980/genre_map_decoration.png', alt: 'Decoration' },
-    { id: 'data', src: 'img/1980/genre_map_data.png', alt: 'Data' },
-    { id: 'elements', src: 'img/common/elements.png', alt: 'Elements' }
+    { id: 'decoration', layer: '1980/genre_map_decoration', alt: 'Decoration' },
+    { id: 'data', layer: '1980/genre_map_data', alt: 'Data' },
+    { id: 'elements', layer: 'common/elements', alt: 'Elements' }
   ];
 
   const genreLayers = {
@@ -15,6 +15,122 @@ document.addEventListener('DOMContentLoaded', () => {
     Urban_Latin: 'Urban_Latin.png'
   };
 
+  // Manifest de les imatges exportades per al web (img/manifest.json): format preferit i precàrrega
+  let assetManifest = null;
+  const supportsWebp = document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+
+  function assetUrl(layer) {
+    const entry = assetManifest?.layers[layer];
+    if (!entry) {
+      return `img/${layer}.png`;
+    }
+    const file = (supportsWebp && entry.webp) || entry.png || entry.webp || entry.webp_lossless;
+    return `img/${file.file}?v=${file.hash}`;
+  }
+
+  // Sprite sheets de cada tipus de capa (img/atlas.json): un fitxer per capa per a tota l'animació
+  let atlasManifest = null;
+
+  function fetchJson(url) {
+    return fetch(url)
+      .then(response => response.ok ? response.json() : null)
+      .catch(() => null);
+  }
+
+  const manifestsReady = Promise.all([fetchJson('img/manifest.json'), fetchJson('img/atlas.json')])
+    .then(([manifest, atlas]) => {
+      assetManifest = manifest;
+      atlasManifest = atlas;
+    });
+
+  const images = new Map();
+  function loadImage(url) {
+    if (!images.has(url)) {
+      images.set(url, new Promise((resolve, reject) => {
+        const img = new Image();
+        img.onload = () => resolve(img);
+        img.onerror = reject;
+        img.src = url;
+      }));
+    }
+    return images.get(url);
+  }
+
+  function atlasUrl(entry) {
+    return `img/${entry.file}?v=${entry.hash}`;
+  }
+
+  // Peces que formen una capa ([url, sx, sy, amplada, alçada, dx, dy]) i la mida del frame
+  function layerSprites(layer) {
+    const split = layer.lastIndexOf('/');
+    const folder = layer.slice(0, split);
+    const name = layer.slice(split + 1);
+
+    if (atlasManifest) {
+      const decoration = atlasManifest.decoration;
+      if (name === 'genre_map_decoration' && decoration) {
+        const [w, h] = decoration.frame_size;
+        const sprites = [[atlasUrl(decoration.background), 0, 0, w, h, 0, 0]];
+        const offset = decoration.strip?.offsets[folder];
+        if (offset) {
+          const [x, y, sw, sh] = decoration.strip.box;
+          sprites.push([atlasUrl(decoration.strip), offset[0], offset[1], sw, sh, x, y]);
+        }
+        return { size: [w, h], sprites };
+      }
+
+      const entry = atlasManifest.layers[name];
+      const offset = entry?.offsets[folder];
+      if (offset) {
+        const [w, h] = entry.frame_size;
+        return { size: [w, h], sprites: [[atlasUrl(entry), offset[0], offset[1], w, h, 0, 0]] };
+      }
+    }
+    return { size: null, sprites: [[assetUrl(layer), 0, 0, null, null, 0, 0]] };
+  }
+
+  // Dibuixa una capa al seu canvas (un fitxer sencer o un tros d'un atlas)
+  async function drawLayer(canvas, layer) {
+    canvas.dataset.layer = layer;
+    await manifestsReady;
+
+    const { size, sprites } = layerSprites(layer);
+    let imgs;
+    try {
+      imgs = await Promise.all(sprites.map(sprite => loadImage(sprite[0])));
+    } catch {
+      return;
+    }
+
+    // Mentrestant s'ha demanat un altre frame per aquest canvas
+    if (canvas.dataset.layer !== layer) return;
+
+    const [w, h] = size || [imgs[0].naturalWidth, imgs[0].naturalHeight];
+    if (canvas.width !== w || canvas.height !== h) {
+      canvas.width = w;
+      canvas.height = h;
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, w, h);
+    sprites.forEach(([, sx, sy, sw, sh, dx, dy], i) => {
+      ctx.drawImage(imgs[i], sx, sy, sw ?? w, sh ?? h, dx, dy, sw ?? w, sh ?? h);
+    });
+  }
+
+  async function preloadStep(folder) {
+    await manifestsReady;
+    const layers = [`${folder}/genre_map_data`];
+    if (!folder.includes('/')) {
+      layers.push(`${folder}/genre_map_decoration`);
+    }
+    if (selectedGenre) {
+      layers.push(`${folder}/${selectedGenre}`);
+    }
+    layers.forEach(layer => {
+      layerSprites(layer).sprites.forEach(sprite => loadImage(sprite[0]).catch(() => {}));
+    });
+  }
+
   let genreData = {};
   fetch('data/genres_summary.json')
   .then(response => response.json())
@@ -22,6 +138,7 @@ document.addEventListener('DOMContentLoaded', () => {
     genreData = data;
   });
 
+  // Color de cada gènere al mapa de dades: es fa servir si el pas no té genre_index.json
   const genreColors = {
     '33,120,181': 'Classical',
     '51,162,50': 'Folk & Country',
@@ -32,6 +149,30 @@ document.addEventListener('DOMContentLoaded', () => {
     '151,106,190': 'Metal'
   };
 
+  // Índexs de gènere dominant per pas de l'animació (genre_index.json), carregats sota demanda
+  const frameIndexes = {};
+
+  function decodeArray(base64, ArrayType = Uint8Array) {
+    const bytes = Uint8Array.from(atob(base64), c => c.charCodeAt(0));
+    return new ArrayType(bytes.buffer);
+  }
+
+  function loadFrameIndex(folder) {
+    if (!frameIndexes[folder]) {
+      frameIndexes[folder] = fetchJson(`img/${folder}/genre_index.json`)
+        .then(index => index && ({
+          ...index,
+          grid: decodeArray(index.grid),
+          counts: index.counts && decodeArray(index.counts, Uint16Array),
+          genre_counts: index.genre_counts && decodeArray(index.genre_counts, Uint16Array),
+          valence: index.valence && decodeArray(index.valence),
+          energy: index.energy && decodeArray(index.energy)
+        }))
+        .catch(() => null);
+    }
+    return frameIndexes[folder];
+  }
+
   const decades = ['1980', '1990', '2000', '2010', '2020'];
 
   const animationSteps = [];
@@ -58,46 +199,52 @@ document.addEventListener('DOMContentLoaded', () => {
   let isPlaying = false;
   let currentStepIndex = 0;
   let currentDecade = decades[0]
+  let currentFolder = decades[0];
 
-  // Helper: crea una imatge dins el contenidor
-  function createImage(id, src, alt) {
-    const img = document.createElement('img');
-    img.id = id;
-    img.src = src;
-    img.alt = alt;
-    img.classList.add('genre-layer');
-    container.appendChild(img);
-    return img;
+  // Helper: crea una capa (canvas) dins el contenidor
+  function createLayer(id, layer, alt) {
+    const canvas = document.createElement('canvas');
+    canvas.id = id;
+    canvas.setAttribute('aria-label', alt);
+    canvas.classList.add('genre-layer');
+    container.appendChild(canvas);
+    drawLayer(canvas, layer);
+    return canvas;
   }
 
   // Carreguem les capes base
   baseLayers.forEach(layer => {
-    createImage(layer.id, layer.src, layer.alt);
+    createLayer(layer.id, layer.layer, layer.alt);
   });
 
   function loadDecadeLayers(folder) {
     // Determina si és una dècada (ex: '1980') o un interpolat (ex: '1980/interpolated_1')
     currentDecade = folder.split('/')[0];
+    currentFolder = folder;
+    loadFrameIndex(folder);
 
     const isInterpolated = folder.includes('/');
   
     // Carreguem data
-    document.getElementById('data').src = `img/${folder}/genre_map_data.png`;
+    drawLayer(document.getElementById('data'), `${folder}/genre_map_data`);
   
     // Carreguem decoration només si NO és interpolació
     if (!isInterpolated) {
-      document.getElementById('decoration').src = `img/${folder}/genre_map_decoration.png`;
+      drawLayer(document.getElementById('decoration'), `${folder}/genre_map_decoration`);
     }
   
-    // Actualitza la capa de gènere si està seleccionada
-    if (currentGenreImg) {
+    // Actualitza la capa de gènere si està seleccionada (es redibuixa el mateix canvas)
+    if (currentGenreImg && !selectedGenre) {
       container.removeChild(currentGenreImg);
       currentGenreImg = null;
     }
   
     if (selectedGenre) {
-      const genrePath = `img/${folder}/${selectedGenre}.png`;
-      currentGenreImg = createImage('genre', genrePath, selectedGenre);
+      if (currentGenreImg) {
+        drawLayer(currentGenreImg, `${folder}/${selectedGenre}`);
+      } else {
+        currentGenreImg = createLayer('genre', `${folder}/${selectedGenre}`, selectedGenre);
+      }
       currentGenreImg.style.opacity = 1 - (opacitySlider.value / 100);
     }
   
@@ -147,8 +294,8 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     if (selectedGenre) {
-      const genrePath = `img/${decades[0]}/${genreLayers[selectedGenre]}`;
-      currentGenreImg = createImage('genre', genrePath, selectedGenre);
+      const genreLayer = `${decades[0]}/${genreLayers[selectedGenre].replace(/\.png$/, '')}`;
+      currentGenreImg = createLayer('genre', genreLayer, selectedGenre);
       opacityElement.classList.remove('hidden');
     } else {
       opacityElement.classList.add('hidden');
@@ -175,6 +322,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const folder = animationSteps[currentStepIndex];
     loadDecadeLayers(folder);
     currentStepIndex = (currentStepIndex + 1) % animationSteps.length;
+    preloadStep(animationSteps[currentStepIndex]);
     setTimeout(stepAnimation, 800); // Ajusta la durada segons preferències
   }
 
@@ -204,23 +352,32 @@ document.addEventListener('DOMContentLoaded', () => {
     loadDecadeLayers(animationSteps[currentStepIndex]);
   });
 
-  function showInfoBox(event, genre, decade) {
-    if (!genreData.genres[genre]) {
+  function showInfoBox(event, genre, decade, local = null) {
+    if (!genreData.genres?.[genre]) {
       return;
     }
 
     const decadeKey = `${parseFloat(decade).toFixed(1)}`;
   
     const globalInfo = genreData.genres[genre];
-    const decadeInfo = genreData.decades[decadeKey]?.[genre] || {};
+    const decadeInfo = genreData.frames?.[currentFolder]?.[genre] || genreData.decades[decadeKey]?.[genre] || {};
   
-    const htmlContent = `
+    let htmlContent = `
       <strong>Genre:</strong> ${genre}<br>
       <strong>Total cançons:</strong> ${globalInfo.num_songs}<br>
       <strong>Total decade ${parseInt(decadeKey)}:</strong> ${decadeInfo.num_songs || 'N/A'}<br>
       <strong>Mean energy:</strong> ${(decadeInfo.avg_energy ?? globalInfo.avg_energy).toFixed(2)}<br>
       <strong>Mean valence:</strong> ${(decadeInfo.avg_valence ?? globalInfo.avg_valence).toFixed(2)}
     `;
+
+    // Estadístiques de la zona clicada (només als frames que no són interpolats)
+    if (local && local.count > 0) {
+      htmlContent += `<br>
+      <strong>Cançons a la zona:</strong> ${local.count} (${local.genreCount} ${genre})<br>
+      <strong>Energy a la zona:</strong> ${local.energy.toFixed(2)}<br>
+      <strong>Valence a la zona:</strong> ${local.valence.toFixed(2)}
+    `;
+    }
   
     const box = document.getElementById('infoBox');
     box.innerHTML = htmlContent;
@@ -243,47 +400,88 @@ document.addEventListener('DOMContentLoaded', () => {
     );
   }
 
-  document.getElementById('container').addEventListener('click', (event) => {
-    const dataLayer = document.getElementById('data');
-    if (!dataLayer) return;
-  
-    let canvas = document.getElementById('tempCanvas');
-    if (!canvas) {
-      canvas = document.createElement('canvas');
-      canvas.id = 'tempCanvas';
-      canvas.style.display = 'none';
-      document.body.appendChild(canvas);
-    }
-  
-    const ctx = canvas.getContext('2d');
-    canvas.width = dataLayer.naturalWidth;
-    canvas.height = dataLayer.naturalHeight;
-    ctx.drawImage(dataLayer, 0, 0);
-  
-    const rect = dataLayer.getBoundingClientRect();
-    const scaleX = dataLayer.naturalWidth / rect.width;
-    const scaleY = dataLayer.naturalHeight / rect.height;
-  
-    const x = Math.floor((event.clientX - rect.left) * scaleX);
-    const y = Math.floor((event.clientY - rect.top) * scaleY);
-  
-    const pixel = ctx.getImageData(x, y, 1, 1).data;
+  // Gènere segons el color del píxel clicat a la capa de dades (sense índex del pas)
+  function genreFromPixel(dataLayer, fx, fy) {
+    const x = Math.min(dataLayer.width - 1, Math.floor(fx * dataLayer.width));
+    const y = Math.min(dataLayer.height - 1, Math.floor((1 - fy) * dataLayer.height));
+    const pixel = dataLayer.getContext('2d').getImageData(x, y, 1, 1).data;
     const clickedColor = [pixel[0], pixel[1], pixel[2]];
-  
-    let found = false;
+
     for (const colorKey in genreColors) {
       const refColor = colorKey.split(',').map(Number);
       if (isSimilarColor(clickedColor, refColor, 50)) {
-        const genre = genreColors[colorKey];
+        return genreColors[colorKey];
+      }
+    }
+    return null;
+  }
+
+  document.getElementById('container').addEventListener('click', async (event) => {
+    const dataLayer = document.getElementById('data');
+    if (!dataLayer || !dataLayer.width) return;
+
+    // Posició del clic en coordenades de valence/energy dins els eixos de la imatge.
+    // La capa es mostra amb object-fit: contain, centrada dins l'element
+    const box = dataLayer.getBoundingClientRect();
+    const scale = Math.min(box.width / dataLayer.width, box.height / dataLayer.height);
+    const rect = {
+      width: dataLayer.width * scale,
+      height: dataLayer.height * scale
+    };
+    rect.left = box.left + (box.width - rect.width) / 2;
+    rect.top = box.top + (box.height - rect.height) / 2;
+    const fx = (event.clientX - rect.left) / rect.width;
+    const fy = 1 - (event.clientY - rect.top) / rect.height;
+    if (fx < 0 || fx > 1 || fy < 0 || fy > 1) {
+      hideInfoBox();
+      return;
+    }
+
+    // Sense genre_index.json (per exemple, imatges exportades abans de generar-lo) es fa
+    // servir el color del píxel de la capa de dades
+    const folder = currentFolder;
+    const index = await loadFrameIndex(folder);
+    if (!index) {
+      const genre = genreFromPixel(dataLayer, fx, fy);
+      if (genre) {
         showInfoBox(event, genre, currentDecade);
-        found = true;
-        break;
+      } else {
+        hideInfoBox();
       }
+      return;
     }
-  
-    if (!found) {
+
+    const [left, bottom, right, top] = index.axes;
+    const valence = (fx - left) / (right - left);
+    const energy = (fy - bottom) / (top - bottom);
+
+    if (valence < 0 || valence > 1 || energy < 0 || energy > 1) {
       hideInfoBox();
+      return;
     }
+
+    const size = index.size;
+    const col = Math.min(size - 1, Math.floor(valence * size));
+    const row = Math.min(size - 1, Math.floor(energy * size));
+    const cell = row * size + col;
+
+    const genreId = index.grid[cell];
+    if (genreId === 255) {
+      hideInfoBox();
+      return;
+    }
+
+    let local = null;
+    if (index.counts) {
+      local = {
+        count: index.counts[cell],
+        genreCount: index.genre_counts[cell],
+        valence: index.valence[cell] / 250,
+        energy: index.energy[cell] / 250
+      };
+    }
+
+    showInfoBox(event, index.genres[genreId], currentDecade, local);
   });
 
   // Inicialització
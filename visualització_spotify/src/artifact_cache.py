@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+class ArtifactCache():
+    """
+    Cache d'artefactes intermedis indexada pel hash de les seves entrades i paràmetres.
+    Guarda un manifest amb la mida i l'últim accés de cada entrada i n'elimina les
+    menys usades (LRU) quan es supera 'max_bytes' o 'max_entries'.
+    """
+    def __init__(self, cache_dir='data/cache', max_bytes=2 * 1024 ** 3, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.lock_path = os.path.join(cache_dir, 'manifest.lock')
+
+    @contextmanager
+    def _locked(self, timeout=60):
+        # Bloqueig simple entre processos amb un fitxer creat de forma exclusiva
+        os.makedirs(self.cache_dir, exist_ok=True)
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if time.time() - start > timeout:
+                    # Bloqueig orfe d'una execució interrompuda
+                    os.remove(self.lock_path)
+                    start = time.time()
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(self.lock_path)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _update(self, hasher, part):
+        if isinstance(part, pd.DataFrame):
+            hasher.update(json.dumps(list(map(str, part.columns))).encode())
+            hasher.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        elif isinstance(part, np.ndarray):
+            hasher.update(f'{part.dtype}{part.shape}'.encode())
+            hasher.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, dict) and any(isinstance(v, np.ndarray) for v in part.values()):
+            for k in sorted(part):
+                hasher.update(str(k).encode())
+                self._update(hasher, part[k])
+        elif isinstance(part, (list, tuple)) and any(isinstance(v, (dict, np.ndarray, pd.DataFrame)) for v in part):
+            for item in part:
+                self._update(hasher, item)
+        else:
+            hasher.update(json.dumps(part, sort_keys=True, default=str).encode())
+
+    def key(self, stage, *parts):
+        # Clau de l'artefacte: hash del nom de l'etapa, les dades d'entrada i els paràmetres
+        hasher = hashlib.sha256(stage.encode())
+        for part in parts:
+            self._update(hasher, part)
+        return f'{stage}-{hasher.hexdigest()[:32]}'
+
+    def file_digest(self, path, chunk_size=1024 * 1024):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def fetch(self, key, dest_path):
+        # Copia l'artefacte a 'dest_path' si és a la cache. Retorna si hi era.
+        with self._locked():
+            manifest = self._load_manifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return False
+
+            cached_path = os.path.join(self.cache_dir, entry['file'])
+            if not os.path.exists(cached_path):
+                del manifest[key]
+                self._save_manifest(manifest)
+                return False
+
+            entry['last_access'] = time.time()
+            self._save_manifest(manifest)
+
+        dest_dir = os.path.dirname(dest_path)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        shutil.copyfile(cached_path, dest_path)
+        return True
+
+    def fetch_arrays(self, key):
+        # Retorna el diccionari d'arrays guardat amb 'store_arrays', o None
+        with self._locked():
+            manifest = self._load_manifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+
+            cached_path = os.path.join(self.cache_dir, entry['file'])
+            if not os.path.exists(cached_path):
+                del manifest[key]
+                self._save_manifest(manifest)
+                return None
+
+            entry['last_access'] = time.time()
+            self._save_manifest(manifest)
+
+        with np.load(cached_path, allow_pickle=False) as loaded:
+            return {name: loaded[name] for name in loaded.files}
+
+    def store(self, key, src_path):
+        # Afegeix una còpia de 'src_path' a la cache i aplica la política d'evicció
+        ext = os.path.splitext(src_path)[1]
+        filename = f'{key}{ext}'
+        os.makedirs(self.cache_dir, exist_ok=True)
+        shutil.copyfile(src_path, os.path.join(self.cache_dir, filename))
+        self._register(key, filename)
+
+    def store_arrays(self, key, arrays):
+        # Guarda un diccionari d'arrays (sense pickle) com a artefacte
+        filename = f'{key}.npz'
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(os.path.join(self.cache_dir, filename), **arrays)
+        self._register(key, filename)
+
+    def _register(self, key, filename):
+        with self._locked():
+            manifest = self._load_manifest()
+            now = time.time()
+            manifest[key] = {
+                'file': filename,
+                'size': os.path.getsize(os.path.join(self.cache_dir, filename)),
+                'created': now,
+                'last_access': now,
+            }
+            self._evict(manifest)
+            self._save_manifest(manifest)
+
+    def _evict(self, manifest):
+        # Elimina les entrades menys usades fins a complir els límits
+        by_access = sorted(manifest, key=lambda k: manifest[k]['last_access'])
+        total = sum(entry['size'] for entry in manifest.values())
+
+        while by_access and (
+            (self.max_bytes is not None and total > self.max_bytes) or
+            (self.max_entries is not None and len(manifest) > self.max_entries)
+        ):
+            oldest = by_access.pop(0)
+            entry = manifest.pop(oldest)
+            total -= entry['size']
+            cached_path = os.path.join(self.cache_dir, entry['file'])
+            if os.path.exists(cached_path):
+                os.remove(cached_path)
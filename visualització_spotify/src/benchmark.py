@@ -0,0 +1,302 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import k_means
+from data_processor import DataProcessor
+from genre_kde_plots import GenreKDEVisualizer
+from kde_store import KDEStore
+from sampler import ReservoirSampler
+from table_io import write_table
+
+# Grups de la taxonomia que el preprocessament descarta
+EXCLUDED_GROUPS = ('Other', 'Entertainment / Kids', 'Chill / Ambient')
+
+
+def synthetic_dataset(n_rows, decades=(1980, 1990, 2000, 2010, 2020), n_genres=20, seed=0, taxonomy_path=None):
+    """
+    Dataset amb les columnes del CSV original. Els 'track_genre' es prenen de la taxonomia
+    repartits entre grups, i cada gènere té un núvol gaussià propi de valence/energy.
+    """
+    rng = np.random.default_rng(seed)
+
+    if taxonomy_path is None:
+        taxonomy_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'genre_taxonomy.json')
+    with open(taxonomy_path, encoding='utf-8') as f:
+        groups = [genres for group, genres in json.load(f)['groups'].items() if group not in EXCLUDED_GROUPS]
+
+    # Un gènere de cada grup per torns, perquè k-means tingui prou grups
+    genres = []
+    for i in range(max(len(group) for group in groups)):
+        genres.extend(group[i] for group in groups if i < len(group))
+    genres = (genres * (n_genres // len(genres) + 1))[:n_genres]
+    if len(set(genres)) < 7:
+        raise ValueError("Calen com a mínim 7 gèneres diferents per als 7 clústers de k-means")
+
+    centers = rng.uniform(0.2, 0.8, size=(len(genres), 2))
+    genre_ids = rng.integers(0, len(genres), n_rows)
+    points = np.clip(centers[genre_ids] + rng.normal(0, 0.12, size=(n_rows, 2)), 0, 1)
+
+    decades = np.asarray(decades)
+    years = decades[rng.integers(0, len(decades), n_rows)] + rng.integers(0, 10, n_rows)
+
+    ids = np.arange(n_rows).astype(str)
+    return pd.DataFrame({
+        'track_id': np.char.add('track_', ids),
+        'artists': np.char.add('artist_', (np.arange(n_rows) % 5000).astype(str)),
+        'track_name': np.char.add('song_', ids),
+        'track_genre': np.array(genres, dtype=object)[genre_ids],
+        'valence': points[:, 0],
+        'energy': points[:, 1],
+        'year': years.astype(float),
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark():
+    """
+    Temps (millor de 'repeat' execucions) i pic de memòria (tracemalloc, en una execució a part)
+    de cada etapa, amb els paràmetres i les mètriques de precisió de cada mesura.
+    """
+    def __init__(self, repeat=3, memory=True):
+        self.repeat = repeat
+        self.memory = memory
+        self.results = []
+
+    def measure(self, stage, fn, setup=None, **params):
+        times = []
+        result = None
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            gc.collect()
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+
+        peak = None
+        if self.memory:
+            if setup is not None:
+                setup()
+            gc.collect()
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        record = {
+            'stage': stage,
+            **params,
+            'seconds': min(times),
+            'mean_seconds': sum(times) / len(times),
+            'peak_bytes': peak,
+        }
+        self.results.append(record)
+        print(f"{stage:<32} {params} {record['seconds']:.4f}s")
+        return result, record
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _max_rss():
+    # Pic de memòria resident del procés (ru_maxrss és en KB a Linux i en bytes a macOS)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+
+def _max_abs_error(a, b):
+    return float(np.max(np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64))))
+
+
+def run_data_stages(bench, rows, tmp_dir, decades, n_genres, sample_size, seed):
+    # Preprocessament i k-means sobre un CSV sintètic de 'rows' files
+    input_path = os.path.join(tmp_dir, f'input_{rows}.csv')
+    processed_path = os.path.join(tmp_dir, f'processed_{rows}.parquet')
+    k_means_path = os.path.join(tmp_dir, f'k_means_{rows}.parquet')
+    write_table(synthetic_dataset(rows, decades, n_genres, seed), input_path)
+
+    processor = DataProcessor(sampler=ReservoirSampler(sample_size, seed=seed))
+    df, _ = bench.measure(
+        'preprocess_data',
+        lambda: processor.preprocess_data(input_path, processed_path),
+        setup=lambda: _remove(processed_path),
+        rows=rows
+    )
+
+    df, _ = bench.measure(
+        'get_clusters_df',
+        lambda: k_means.get_clusters_df(df, False, processed_path, k_means_path),
+        setup=lambda: _remove(k_means_path),
+        rows=rows
+    )
+    return df
+
+
+def run_kde_stages(bench, df, resolution, tmp_dir, num_interpolated_frames, render):
+    """
+    Etapes de GenreKDEVisualizer a una resolució: KDE (exacta i FFT), interpolació amb splines,
+    mapa dominant i renderitzat. La precisió es compara amb la implementació exacta en float64.
+    """
+    store = KDEStore(os.path.join(tmp_dir, f'kdes_{resolution}'))
+    visualizer = GenreKDEVisualizer(df, resolution=resolution, kde_store=store)
+    decades = sorted(df['decade'].dropna().unique())
+    params = {'resolution': resolution, 'rows': len(df)}
+
+    # KDEs de totes les dècades amb cada backend
+    def compute_kdes(backend):
+        visualizer.kde_backend = backend
+        kde_dicts = []
+        for decade in decades:
+            subset = df[df['decade'] == decade]
+            kde_dicts.append({
+                genre: visualizer._compute_kde(subset[subset['genre_cluster'] == genre][['valence', 'energy']].values)
+                for genre in visualizer.genres
+            })
+        return kde_dicts
+
+    exact, _ = bench.measure('_compute_kde[exact]', lambda: compute_kdes('exact'), **params)
+    fft, record = bench.measure('_compute_kde[fft]', lambda: compute_kdes('fft'), **params)
+    record['max_abs_error'] = max(
+        _max_abs_error(a[genre], b[genre]) for a, b in zip(exact, fft) for genre in visualizer.genres
+    )
+
+    # Interpolació de tots els frames entre dècades
+    target_years = [
+        d1 + (d2 - d1) * step / (num_interpolated_frames + 1)
+        for d1, d2 in zip(decades[:-1], decades[1:])
+        for step in range(1, num_interpolated_frames + 1)
+    ]
+    frames, record = bench.measure(
+        'spline_interpolate_kdes',
+        lambda: visualizer._interpolate_frames(visualizer._fit_genre_splines(exact, decades), target_years, 0.4),
+        frames=len(target_years),
+        **params
+    )
+
+    # Mapa dominant: un frame, i tots els frames en lot (float64 i float32)
+    _, record = bench.measure('_dominant_genre_map_smooth', lambda: visualizer._dominant_genre_map_smooth(exact[0]), **params)
+    reference = visualizer._dominant_genre_map_smooth(exact[0])
+
+    density_cube = np.stack([[kde.get(genre, np.zeros_like(visualizer.x_grid)) for genre in visualizer.genres]
+                             for kde in exact + frames])
+    batch_params = {'frames': len(density_cube), **params}
+    bench.measure('_dominant_genre_map_smooth_batch', lambda: visualizer._dominant_genre_map_smooth_batch(density_cube),
+                  **batch_params)
+    (imgs, alphas), record = bench.measure(
+        '_dominant_genre_map_smooth_batch[float32]',
+        lambda: visualizer._dominant_genre_map_smooth_batch(density_cube.astype(np.float32), dtype=np.float32),
+        **batch_params
+    )
+    record['max_abs_error'] = max(_max_abs_error(imgs[0], reference[0]), _max_abs_error(alphas[0], reference[1]))
+
+    if not render:
+        return
+
+    # Renderitzat de les capes a PNG amb cada renderitzador
+    img, alpha = reference
+    margins = visualizer.default_margins
+    genre = visualizer.genres[0]
+    for renderer in ('matplotlib', 'raster'):
+        visualizer.renderer = renderer
+        output_dir = os.path.join(tmp_dir, f'render_{resolution}_{renderer}')
+        os.makedirs(output_dir, exist_ok=True)
+
+        _, record = bench.measure(
+            f'plot_base_layer[{renderer}]',
+            lambda: visualizer.plot_base_layer(img, alpha, 300, visualizer.default_fig_size, margins, output_dir),
+            **params
+        )
+        record['bytes_written'] = os.path.getsize(os.path.join(output_dir, 'genre_map_data.png'))
+        _, record = bench.measure(
+            f'_plot_highlighted_layer[{renderer}]',
+            lambda: visualizer._plot_highlighted_layer(genre, exact[0], os.path.join(output_dir, 'genre.png')),
+            **params
+        )
+        record['bytes_written'] = os.path.getsize(os.path.join(output_dir, 'genre.png'))
+
+    # Diferència mitjana del PNG ràster respecte al de matplotlib (valors 0-255). El màxim no
+    # és representatiu: les vores de les cel·les poden caure un píxel més enllà
+    raster, reference = (
+        np.array(Image.open(os.path.join(tmp_dir, f'render_{resolution}_{name}', 'genre.png')).convert('RGBA'),
+                   dtype=np.float64)
+        for name in ('raster', 'matplotlib')
+    )
+    # Es compara amb colors premultiplicats: el color dels píxels transparents no es veu
+    raster[..., :3] *= raster[..., 3:] / 255
+    reference[..., :3] *= reference[..., 3:] / 255
+    record['mean_abs_error'] = float(np.mean(np.abs(raster - reference)))
+
+    output_dir = os.path.join(tmp_dir, f'render_{resolution}_decoration')
+    bench.measure('plot_decorators', lambda: visualizer.plot_decorators(output_dir=output_dir, decade='1980'), **params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de visualització amb dades sintètiques")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[100, 200, 300])
+    parser.add_argument('--decades', type=int, nargs='+', default=[1980, 1990, 2000, 2010, 2020])
+    parser.add_argument('--genres', type=int, default=20, help="Nombre de 'track_genre' diferents")
+    parser.add_argument('--sample-size', type=int, default=10_000, help="Mida de la mostra del preprocessament")
+    parser.add_argument('--interpolated-frames', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help="No mesura el pic de memòria (tracemalloc)")
+    parser.add_argument('--no-render', action='store_true', help="No mesura el renderitzat a PNG")
+    parser.add_argument('--output', default='data/benchmark_results.json')
+    args = parser.parse_args()
+
+    bench = Benchmark(repeat=args.repeat, memory=not args.no_memory)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        df = None
+        for rows in args.rows:
+            df = run_data_stages(bench, rows, tmp_dir, args.decades, args.genres, args.sample_size, args.seed)
+
+        # Les etapes de KDE treballen sobre la mostra del preprocessament (la de l'últim dataset)
+        for resolution in args.resolutions:
+            run_kde_stages(bench, df, resolution, tmp_dir, args.interpolated_frames, not args.no_render)
+
+    output = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'max_rss_bytes': _max_rss(),
+        'params': vars(args),
+        'results': bench.results,
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=4)
+    print(f"Resultats desats a {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,73 +1,125 @@
 import pandas as pd
+import json
 import os
 import numpy as np
+from sampler import ReservoirSampler
+from table_io import read_table, write_table
 
 class DataProcessor():
-    def __init__(self):
-        pass
+    # Columnes del dataset original que fa servir el preprocessament
+    input_columns = ['track_id', 'artists', 'track_name', 'track_genre', 'valence', 'energy', 'year']
 
-    def _remove_outliers_iqr(self, subset):
-        for col in ['valence', 'energy']:
-            Q1 = subset[col].quantile(0.25)
-            Q3 = subset[col].quantile(0.75)
+    def __init__(self, cache=None, taxonomy_path=None, sampler=None):
+        self.cache = cache
+
+        # Mostreig amb llavor: la mateixa entrada dona sempre la mateixa mostra
+        self.sampler = sampler or ReservoirSampler(10000, seed=42)
+
+        # Taxonomia de gèneres configurable (per defecte, genre_taxonomy.json al costat d'aquest mòdul)
+        if taxonomy_path is None:
+            taxonomy_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'genre_taxonomy.json')
+        self.taxonomy, self.default_group = self._load_taxonomy(taxonomy_path)
+
+    def _remove_outliers_iqr(self, df, group_col='genre_group', columns=('valence', 'energy')):
+        """
+        Elimina els outliers per IQR dins de cada grup amb una sola màscara.
+        Les columnes es filtren en ordre: els quartils d'energy es calculen sobre les files que ja han passat valence.
+        """
+        # Les files sense grup queden fora, com amb groupby
+        codes, uniques = pd.factorize(df[group_col])
+        keep = codes >= 0
+
+        for col in columns:
+            # Quartils de tots els grups alhora, només amb les files que encara es conserven
+            values = df[col].to_numpy()
+            quartiles = (
+                pd.Series(values[keep])
+                .groupby(codes[keep])
+                .quantile([0.25, 0.75])
+                .unstack()
+                .reindex(range(len(uniques)))
+            )
+
+            Q1 = quartiles[0.25].to_numpy()
+            Q3 = quartiles[0.75].to_numpy()
             IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            subset = subset[(subset[col] >= lower_bound) & (subset[col] <= upper_bound)]
-        return subset
+            lower_bound = (Q1 - 1.5 * IQR)[codes]
+            upper_bound = (Q3 + 1.5 * IQR)[codes]
+
+            keep &= (values >= lower_bound) & (values <= upper_bound)
+        return df[keep]
     
 
-    def _simplify_genre(self, genre):
-        genre = genre.lower()
-        if genre in ['pop', 'power-pop', 'pop-film', 'party', 'happy']:
-            return 'Pop'
-        elif genre in ['rock', 'alt-rock', 'hard-rock', 'punk', 'punk-rock', 'grunge', 'garage', 'psych-rock', 'rock-n-roll', 'rockabilly']:
-            return 'Rock'
-        elif genre in ['hip-hop', 'rap', 'r-n-b']:
-            return 'Hip-Hop / R&B'
-        elif genre in ['electronic', 'edm', 'electro', 'trance', 'house', 'techno', 'deep-house', 'minimal-techno', 'progressive-house', 'club', 'dance', 'dancehall', 'detroit-techno', 'chicago-house', 'drum-and-bass', 'dubstep']:
-            return 'Electronic'
-        elif genre in ['classical', 'opera', 'piano', 'new-age']:
-            return 'Classical'
-        elif genre in ['jazz', 'blues', 'funk', 'soul', 'groove', 'gospel']:
-            return 'Jazz / Soul'
-        elif genre in ['country', 'folk', 'bluegrass', 'honky-tonk', 'singer-songwriter', 'songwriter']:
-            return 'Country / Folk'
-        elif genre in ['metal', 'heavy-metal', 'death-metal', 'black-metal', 'metalcore', 'hardcore', 'grindcore']:
-            return 'Metal'
-        elif genre in ['latin', 'latino', 'reggaeton', 'salsa', 'samba', 'brazil', 'forro', 'pagode', 'mpb', 'sertanejo', 'tango']:
-            return 'Latin'
-        elif genre in ['k-pop', 'j-pop', 'j-rock', 'anime', 'j-idol', 'j-dance', 'mandopop', 'cantopop']:
-            return 'Asian Pop'
-        elif genre in ['ambient', 'chill', 'sleep', 'study', 'acoustic']:
-            return 'Chill / Ambient'
-        elif genre in ['comedy', 'kids', 'children', 'disney', 'show-tunes']:
-            return 'Entertainment / Kids'
-        elif genre in ['indie', 'indie-pop', 'alternative']:
-            return 'Indie / Alternative'
-        else:
-            return 'Other'
+    def _load_taxonomy(self, path):
+        """
+        Llegeix la taxonomia {grup: [gèneres]} i la converteix en un diccionari gènere -> grup.
+        Si un gènere apareix en més d'un grup, es queda el primer.
+        """
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+
+        taxonomy = {}
+        for group, genres in config['groups'].items():
+            for genre in genres:
+                taxonomy.setdefault(genre.lower(), group)
+        return taxonomy, config.get('default', 'Other')
+
+    def _simplify_genres(self, genres):
+        """
+        Assigna el grup a cada fila amb una sola consulta per categoria diferent de 'track_genre'.
+        """
+        genres = genres.astype('category')
+        groups = list(dict.fromkeys([*self.taxonomy.values(), self.default_group]))
+        group_codes = {group: i for i, group in enumerate(groups)}
+
+        # Codi de grup per a cada categoria; l'última posició és per als nuls (codi -1)
+        lookup = np.array(
+            [group_codes[self.taxonomy.get(str(genre).lower(), self.default_group)] for genre in genres.cat.categories]
+            + [group_codes[self.default_group]]
+        )
+        codes = lookup[genres.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, groups), index=genres.index)
 
     def preprocess_data(self, original_dataset_path, processed_path):
-        if os.path.exists(processed_path):
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                'preprocess',
+                self.cache.file_digest(original_dataset_path),
+                {
+                    'min_year': 1980,
+                    'sample': self.sampler.params(),
+                    'columns': self.input_columns,
+                    'format': os.path.splitext(processed_path)[1],
+                    'taxonomy': self.taxonomy,
+                    'default_group': self.default_group,
+                }
+            )
+            if self.cache.fetch(cache_key, processed_path):
+                print(f"Recuperat progrés des de {processed_path}")
+                return read_table(processed_path)
+        elif os.path.exists(processed_path):
             print(f"Recuperat progrés des de {processed_path}")
-            return pd.read_csv(processed_path)
+            return read_table(processed_path)
             
-        df = pd.read_csv(original_dataset_path)
+        df = read_table(original_dataset_path, columns=self.input_columns)
         print("Arxiu carregat")
 
-        df['genre_group'] = df['track_genre'].apply(self._simplify_genre)
+        df['genre_group'] = self._simplify_genres(df['track_genre'])
 
         generes_a_excloure = ['Other', 'Entertainment / Kids', 'Chill / Ambient']
         df = df[~df['genre_group'].isin(generes_a_excloure)].copy()
+        df['genre_group'] = df['genre_group'].cat.remove_unused_categories()
 
-        df = df.groupby('genre_group', group_keys=False).apply(self._remove_outliers_iqr)
+        df = self._remove_outliers_iqr(df)
 
         df = df[(df['year'].notna()) & (df['year'] != 0)]
         df = df[df['year'] >= 1980]
         df['decade'] = (df['year'] // 10) * 10
 
-        df = df.sample(10000)
+        df = self.sampler.sample_frame(df)
 
-        df.to_csv(processed_path, index=False)
+        write_table(df, processed_path)
+        if cache_key is not None:
+            self.cache.store(cache_key, processed_path)
         return df
\ No newline at end of file
@@ -1,56 +1,102 @@
 import json
+import numpy as np
 
 class Summarizer():
     def __init__(self):
         pass
 
-    def summarize_genres(self, df, path):
-        summary = df.groupby('genre_cluster').agg(
-            num_songs=('genre_cluster', 'count'),
-            avg_energy=('energy', 'mean'),
-            avg_valence=('valence', 'mean')
-        ).reset_index()
-        
-        summary['avg_energy'] = summary['avg_energy'].round(2)
-        summary['avg_valence'] = summary['avg_valence'].round(2)
-        summary_dict = summary.set_index('genre_cluster').to_dict(orient='index')
-        
-        # Estadístiques per dècada i gènere
-        decades_group = df.groupby(['decade', 'genre_cluster']).agg(
-            num_songs=('genre_cluster', 'count'),
-            avg_energy=('energy', 'mean'),
-            avg_valence=('valence', 'mean')
-        ).reset_index()
-        
-        # Arrodonim
-        decades_group['avg_energy'] = decades_group['avg_energy'].round(2)
-        decades_group['avg_valence'] = decades_group['avg_valence'].round(2)
-        
-        # Creem diccionari amb la jerarquia decade -> genre -> stats
+    def _bucket_key(self, value):
+        # Claus de dècada com '1980.0', que és el format que espera kde_interactive.js
+        return str(float(value))
+
+    def _stats(self, count, energy, valence):
+        return {
+            'num_songs': int(count),
+            'avg_energy': round(float(energy), 2),
+            'avg_valence': round(float(valence), 2)
+        }
+
+    def _frame_stats(self, buckets, bucket_stats, num_interpolated_frames):
+        """
+        Estadístiques de cada pas de l'animació: les dècades tal qual i, entre dues dècades,
+        interpolació lineal per als gèneres presents a totes dues.
+        """
+        frames = {}
+        for i, bucket in enumerate(buckets):
+            frames[str(int(bucket))] = bucket_stats[self._bucket_key(bucket)]
+            if i == len(buckets) - 1:
+                continue
+
+            start = bucket_stats[self._bucket_key(bucket)]
+            end = bucket_stats[self._bucket_key(buckets[i + 1])]
+            for step in range(1, num_interpolated_frames + 1):
+                t = step / (num_interpolated_frames + 1)
+                frames[f'{int(bucket)}/interpolated_{step}'] = {
+                    genre: self._stats(
+                        round((1 - t) * start[genre]['num_songs'] + t * end[genre]['num_songs']),
+                        (1 - t) * start[genre]['avg_energy'] + t * end[genre]['avg_energy'],
+                        (1 - t) * start[genre]['avg_valence'] + t * end[genre]['avg_valence']
+                    )
+                    for genre in start if genre in end
+                }
+        return frames
+
+    def summarize_genres(self, df, path, time_col='decade', num_interpolated_frames=None):
+        """
+        Resum per gènere i per (franja temporal, gènere) amb una sola agregació agrupada.
+        Els totals per gènere surten de sumar els recomptes i les sumes de cada franja.
+        Amb 'num_interpolated_frames' s'hi afegeixen les estadístiques de cada pas de l'animació.
+        """
+        # Una sola passada: recompte i sumes per (franja, gènere). Les files sense franja
+        # es conserven (dropna=False) perquè comptin en el resum global.
+        grouped = df.groupby([time_col, 'genre_cluster'], observed=True, dropna=False).agg(
+            num_songs=('genre_cluster', 'size'),
+            energy_sum=('energy', 'sum'),
+            energy_count=('energy', 'count'),
+            valence_sum=('valence', 'sum'),
+            valence_count=('valence', 'count')
+        )
+        grouped = grouped[grouped.index.get_level_values('genre_cluster').notna()]
+
+        # Totals per gènere a partir de les sumes parcials
+        totals = grouped.groupby(level='genre_cluster', observed=True).sum()
+        summary_dict = {
+            genre: self._stats(count, energy, valence)
+            for genre, count, energy, valence in zip(
+                totals.index,
+                totals['num_songs'].to_numpy(),
+                totals['energy_sum'].to_numpy() / totals['energy_count'].to_numpy(),
+                totals['valence_sum'].to_numpy() / totals['valence_count'].to_numpy()
+            )
+        }
+
+        # Diccionari amb la jerarquia franja -> gènere -> estadístiques
+        grouped = grouped[grouped.index.get_level_values(time_col).notna()]
         decades_dict = {}
-        for _, row in decades_group.iterrows():
-            decade = str(row['decade'])      # <-- arreglat aquí
-            genre = row['genre_cluster']
-            stats = {
-                'num_songs': int(row['num_songs']),
-                'avg_energy': row['avg_energy'],
-                'avg_valence': row['avg_valence']
-            }
-            if decade not in decades_dict:
-                decades_dict[decade] = {}
-            decades_dict[decade][genre] = stats
-        
+        for (bucket, genre), count, energy, valence in zip(
+            grouped.index,
+            grouped['num_songs'].to_numpy(),
+            grouped['energy_sum'].to_numpy() / grouped['energy_count'].to_numpy(),
+            grouped['valence_sum'].to_numpy() / grouped['valence_count'].to_numpy()
+        ):
+            decades_dict.setdefault(self._bucket_key(bucket), {})[genre] = self._stats(count, energy, valence)
+
         # Metadades
         metadata = {
             'total_records': len(df)
         }
-        
+
         # JSON final
         final_json = {
             'metadata': metadata,
             'genres': summary_dict,
             'decades': decades_dict
         }
-        
+
+        if num_interpolated_frames is not None:
+            buckets = np.unique(grouped.index.get_level_values(time_col).to_numpy(dtype=float))
+            final_json['frames'] = self._frame_stats(buckets, decades_dict, num_interpolated_frames)
+
+        # JSON compacte: el descarrega el navegador a cada càrrega de la pàgina
         with open(path, 'w') as f:
-            json.dump(final_json, f, indent=4)
\ No newline at end of file
+            json.dump(final_json, f, separators=(',', ':'))
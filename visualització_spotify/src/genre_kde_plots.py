@@ -1,21 +1,48 @@
 import numpy as np
+import base64
+import json
 import os
 from scipy.stats import gaussian_kde
 from scipy.ndimage import gaussian_filter
+from scipy.signal import fftconvolve
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
 import re
 import matplotlib.colors as mcolors
 from scipy.interpolate import CubicSpline
+from kde_store import KDEStore, interpolated_frame
+import raster_writer
 
 
 class GenreKDEVisualizer:
-    def __init__(self, df, resolution=300, palette='tab10', sigma=5):
+    def __init__(self, df, resolution=300, palette='tab10', sigma=5, kde_backend='exact', cache=None, kde_store=None,
+                 renderer='matplotlib', index_grid_size=60):
         self.df = df
         self.resolution = resolution
         self.palette = palette
         self.sigma = sigma
+        self.cache = cache
+
+        # Cub (frame, gènere, H, W) amb totes les KDEs, obert amb memmap
+        self.kde_store = kde_store if kde_store is not None else KDEStore()
+
+        # Backends disponibles per avaluar la KDE sobre el grid
+        self.kde_backends = {
+            'exact': self._evaluate_kde_exact,
+            'fft': self._evaluate_kde_fft,
+        }
+        if kde_backend not in self.kde_backends:
+            raise ValueError(f"Backend de KDE desconegut: {kde_backend}. Opcions: {list(self.kde_backends)}")
+        self.kde_backend = kde_backend
+
+        # 'matplotlib' dibuixa cada capa amb una figura; 'raster' escriu directament el PNG
+        if renderer not in ('matplotlib', 'raster'):
+            raise ValueError(f"Renderitzador desconegut: {renderer}. Opcions: ['matplotlib', 'raster']")
+        self.renderer = renderer
+
+        # Mida de la graella de baixa resolució que fa servir el clic del frontend (None = no s'exporta)
+        self.index_grid_size = index_grid_size
 
         self.x_grid, self.y_grid = np.meshgrid(
             np.linspace(0, 1, resolution),
@@ -45,9 +72,7 @@ class GenreKDEVisualizer:
             weights = np.ones(values.shape[1]) / values.shape[1]
 
         kde = gaussian_kde(values, weights=weights)
-
-        grid_coords = np.vstack([self.x_grid.ravel(), self.y_grid.ravel()])
-        density = kde(grid_coords).reshape(self.x_grid.shape)
+        density = self.kde_backends[self.kde_backend](kde)
 
         max_density = density.max()
         if max_density > 0:
@@ -59,49 +84,149 @@ class GenreKDEVisualizer:
 
         return density
 
+    def _evaluate_kde_exact(self, kde):
+        # Avaluació directa: cost O(punts x cel·les del grid)
+        grid_coords = np.vstack([self.x_grid.ravel(), self.y_grid.ravel()])
+        return kde(grid_coords).reshape(self.x_grid.shape)
+
+    def _evaluate_kde_fft(self, kde):
+        # Binning lineal dels punts sobre el grid i convolució amb el kernel via FFT.
+        # Fa servir la mateixa covariància (bandwidth de Scott) que gaussian_kde.
+        res = self.resolution
+        step = 1.0 / (res - 1)
+
+        # Posició fraccionària de cada punt dins el grid (x -> columnes, y -> files)
+        pos = np.clip(kde.dataset / step, 0, res - 1)
+        base = np.minimum(np.floor(pos).astype(int), res - 2)
+        frac = pos - base
+
+        binned = np.zeros(res * res)
+        col, row = base
+        fx, fy = frac
+        for d_row, d_col, w in (
+            (0, 0, (1 - fy) * (1 - fx)),
+            (0, 1, (1 - fy) * fx),
+            (1, 0, fy * (1 - fx)),
+            (1, 1, fy * fx),
+        ):
+            flat_idx = (row + d_row) * res + (col + d_col)
+            binned += np.bincount(flat_idx, weights=kde.weights * w, minlength=res * res)
+        binned = binned.reshape(res, res)
+
+        # Kernel gaussià amb la covariància completa, tallat a 4 desviacions
+        cov = kde.covariance
+        half_x = min(res - 1, int(np.ceil(4 * np.sqrt(cov[0, 0]) / step)))
+        half_y = min(res - 1, int(np.ceil(4 * np.sqrt(cov[1, 1]) / step)))
+        off_x, off_y = np.meshgrid(
+            np.arange(-half_x, half_x + 1) * step,
+            np.arange(-half_y, half_y + 1) * step
+        )
+        offsets = np.vstack([off_x.ravel(), off_y.ravel()])
+        inv_cov = np.linalg.inv(cov)
+        energy = np.sum(offsets * (inv_cov @ offsets), axis=0)
+        norm = 1.0 / (2 * np.pi * np.sqrt(np.linalg.det(cov)))
+        kernel = (norm * np.exp(-0.5 * energy)).reshape(off_x.shape)
+
+        density = fftconvolve(binned, kernel, mode='same')
+        return np.clip(density, 0, None)
+
     def _dominant_genre_map_smooth(self, kde_dict):
         # Construeix una matriu amb totes les KDEs en l'ordre de self.genre_color_map
         density_list = [kde_dict.get(genre, np.zeros_like(self.x_grid)) for genre in self.genres]
-        density_stack = np.stack(density_list, axis=-1)  # shape (res, res, n_genres)
+        density_cube = np.stack(density_list)[np.newaxis]  # shape (1, n_genres, res, res)
+
+        img_smooth, alpha = self._dominant_genre_map_smooth_batch(density_cube)
+        return img_smooth[0], alpha[0]
 
-        max_indices = np.argmax(density_stack, axis=-1)
-        max_density = np.max(density_stack, axis=-1)
+    def _dominant_genre_map_smooth_batch(self, density_cube, dtype=np.float64, chunk_size=8):
+        # Mapa dominant suavitzat per a tots els frames d'un cub (frames, gèneres, H, W)
+        n_frames, _, H, W = density_cube.shape
 
         # Obtenim els colors corresponents als gèneres
         color_array = np.array([
             mcolors.to_rgb(self.genre_color_map[genre]) for genre in self.genres
-        ])
-
-        # Creem la imatge amb el color dominant per cada pixel
-        img = color_array[max_indices]
-
-        # Suavitzar la imatge amb filtre gaussià
-        img_smooth = np.zeros_like(img)
-        for i in range(3):
-            img_smooth[..., i] = gaussian_filter(img[..., i], sigma=self.sigma)
-        
-        # El clip s'ha de fer sobre el mateix array (modificar img_smooth)
-        img_smooth = np.clip(img_smooth, 0, 1)
-        
-        max_d = max_density.max()
-        if max_d == 0:
-            alpha = np.zeros_like(max_density)
-        else:
-            alpha = max_density / max_d
-        alpha = np.clip(alpha, 0, 1)
-        
-        return img_smooth, alpha
+        ], dtype=dtype)
+
+        img_smooth = np.empty((n_frames, 3, H, W), dtype=dtype)
+        alpha = np.empty((n_frames, H, W), dtype=dtype)
+
+        # Buffers de treball reutilitzats per tots els blocs de frames
+        chunk_size = max(1, min(chunk_size, n_frames))
+        max_indices = np.empty((chunk_size, H, W), dtype=np.intp)
+        img = np.empty((chunk_size, 3, H, W), dtype=dtype)
+
+        for start in range(0, n_frames, chunk_size):
+            stop = min(start + chunk_size, n_frames)
+            n = stop - start
+            chunk = density_cube[start:stop]
+            max_density = alpha[start:stop]
+
+            np.max(chunk, axis=1, out=max_density)
+            np.argmax(chunk, axis=1, out=max_indices[:n])
+
+            # Creem la imatge amb el color dominant per cada pixel (canals primer)
+            for c in range(3):
+                np.take(color_array[:, c], max_indices[:n], out=img[:n, c])
+
+            # Suavitzat gaussià separable només sobre els eixos espacials, de tots els canals i frames alhora
+            gaussian_filter(img[:n], sigma=(0, 0, self.sigma, self.sigma), output=img_smooth[start:stop])
+
+        np.clip(img_smooth, 0, 1, out=img_smooth)
+
+        # Normalitzem l'alpha de cada frame pel seu màxim
+        max_d = alpha.reshape(n_frames, -1).max(axis=1)
+        safe_max = np.where(max_d > 0, max_d, 1)
+        alpha /= safe_max[:, np.newaxis, np.newaxis]
+        alpha[max_d == 0] = 0
+        np.clip(alpha, 0, 1, out=alpha)
+
+        return np.moveaxis(img_smooth, 1, -1), alpha
+
+    def prepare_kde_store(self, frames):
+        self.kde_store.prepare(self.genres, frames, self.resolution)
+
+    def _artifact_ready(self, cache_key, frame):
+        # Sense cache n'hi ha prou que el frame estigui escrit; amb cache, la clau ha de coincidir
+        if self.cache is None or cache_key is None:
+            return self.kde_store.has_frame(frame)
+
+        arrays = self.cache.fetch_arrays(cache_key)
+        if arrays is None:
+            return False
+        kde_dict = {str(genre): density for genre, density in zip(arrays['genres'], arrays['densities'])}
+        self.kde_store.save_frame(frame, kde_dict)
+        return True
+
+    def _save_kdes(self, cache_key, frame, kde_dict):
+        self.kde_store.save_frame(frame, kde_dict)
+
+        if self.cache is not None and cache_key is not None:
+            genres = [genre for genre in self.genres if genre in kde_dict]
+            densities = np.array([kde_dict[genre] for genre in genres], dtype=np.float32)
+            self.cache.store_arrays(cache_key, {'genres': np.array(genres, dtype=str), 'densities': densities})
+
+    def plot_dominant_map(self, df, frame, output_dir):
+        cache_key = None
+        if self.cache is not None and df is not None:
+            cache_key = self.cache.key(
+                'kde_frame',
+                df[['genre_cluster', 'valence', 'energy']].reset_index(drop=True),
+                {
+                    'genres': self.genres,
+                    'resolution': self.resolution,
+                    'kde_backend': self.kde_backend,
+                    'density_threshold': 0.4,
+                }
+            )
 
-    def plot_dominant_map(self, df, kdes_path, output_dir):
         # Si existeixen els KDEs al disc, els carreguem
-        if os.path.exists(kdes_path):
-            loaded = np.load(kdes_path, allow_pickle=True)
-            kde_dict = loaded['kdes'][()]
+        if self._artifact_ready(cache_key, frame):
+            kde_dict = self.kde_store.load_frame(frame)
 
         # Si no existeixen, hem de generar-los a partir de df
         else:
             if df is None:
-                raise ValueError(f"No es pot generar KDEs perquè 'df' és None i no existeix cap fitxer: {kdes_path}")
+                raise ValueError(f"No es pot generar KDEs perquè 'df' és None i no existeix el frame: {frame}")
 
             kde_dict = {}
 
@@ -122,9 +247,9 @@ class GenreKDEVisualizer:
                 dens = self._compute_kde(subset, density_threshold=0.4, weights=weights)
                 kde_dict[genre] = dens
 
-            # Guardar KDEs al disc
-            os.makedirs(os.path.dirname(kdes_path), exist_ok=True)
-            np.savez(kdes_path, kdes=kde_dict)
+            # Guardar KDEs al disc i treballar amb la mateixa precisió que es llegirà després
+            self._save_kdes(cache_key, frame, kde_dict)
+            kde_dict = self.kde_store.load_frame(frame)
 
         # Generar el mapa dominant a partir dels KDEs carregats
         img, alpha = self._dominant_genre_map_smooth(kde_dict)
@@ -132,6 +257,9 @@ class GenreKDEVisualizer:
         # Crear carpeta de sortida si no existeix
         os.makedirs(output_dir, exist_ok=True)
 
+        density_cube = np.stack([kde_dict.get(genre, np.zeros_like(self.x_grid)) for genre in self.genres])
+        self.export_frame_index(density_cube, output_dir, df)
+
         # Paràmetres de visualització
         figsize = (8, 6)
         dpi = 300
@@ -139,6 +267,88 @@ class GenreKDEVisualizer:
 
         # Dibuixar la capa base
         self.plot_base_layer(img, alpha, dpi, figsize, margins, output_dir)
+
+    def plot_dominant_maps(self, frames, output_dirs, dtype=np.float64):
+        # Mapa dominant de diversos frames ja calculats amb un sol pas vectoritzat
+        density_cube = self.kde_store.load_frames(frames)
+        imgs, alphas = self._dominant_genre_map_smooth_batch(density_cube, dtype=dtype)
+
+        figsize = (8, 6)
+        dpi = 300
+        margins = dict(left=0.1, right=0.8, top=0.9, bottom=0.1)
+
+        for densities, img, alpha, output_dir in zip(density_cube, imgs, alphas, output_dirs):
+            os.makedirs(output_dir, exist_ok=True)
+            self.plot_base_layer(img, alpha, dpi, figsize, margins, output_dir)
+            self.export_frame_index(densities, output_dir)
+
+    def _encode_array(self, array):
+        # Bytes little-endian en base64 (el frontend els llegeix amb Uint8Array/Uint16Array)
+        return base64.b64encode(array.astype(array.dtype.newbyteorder('<')).tobytes()).decode('ascii')
+
+    def export_frame_index(self, density_cube, output_dir, df=None):
+        """
+        Escriu 'genre_index.json': graella de baixa resolució amb el gènere dominant de cada cel·la
+        (uint8, 255 = cap) i, si es passa el df del frame, el recompte de cançons i la valence/energy
+        mitjanes de cada cel·la. La fila 0 correspon a energy = 0 i la columna 0 a valence = 0.
+        """
+        size = self.index_grid_size
+        if not size:
+            return
+
+        # Densitat acumulada de cada gènere per cel·la de la graella
+        _, H, W = density_cube.shape
+        row_edges = (np.arange(size) * H) // size
+        col_edges = (np.arange(size) * W) // size
+        cells = np.add.reduceat(np.asarray(density_cube, dtype=np.float64), row_edges, axis=1)
+        cells = np.add.reduceat(cells, col_edges, axis=2)
+
+        grid = np.argmax(cells, axis=0).astype(np.uint8)
+        grid[cells.max(axis=0) <= 0] = 255
+
+        # Requadre on queda el mapa dins la imatge (aspect 'equal'), en fraccions des de baix a l'esquerra
+        fig_w, fig_h = self.default_fig_size
+        x0, y0, box_w, box_h = raster_writer.axes_box(self.default_fig_size, 100, self.default_margins)
+        axes = [x0 / (fig_w * 100), 1 - (y0 + box_h) / (fig_h * 100),
+                (x0 + box_w) / (fig_w * 100), 1 - y0 / (fig_h * 100)]
+
+        index = {
+            'size': size,
+            'genres': [str(genre) for genre in self.genres],
+            'axes': [round(value, 4) for value in axes],
+            'grid': self._encode_array(grid),
+        }
+
+        if df is not None and len(df) > 0:
+            valence = df['valence'].to_numpy(dtype=np.float64)
+            energy = df['energy'].to_numpy(dtype=np.float64)
+            cols = np.clip((valence * size).astype(int), 0, size - 1)
+            rows = np.clip((energy * size).astype(int), 0, size - 1)
+            flat = rows * size + cols
+
+            counts = np.bincount(flat, minlength=size * size)
+            safe_counts = np.maximum(counts, 1)
+            mean_valence = np.bincount(flat, weights=valence, minlength=size * size) / safe_counts
+            mean_energy = np.bincount(flat, weights=energy, minlength=size * size) / safe_counts
+
+            # Cançons del gènere dominant de cada cel·la
+            genre_ids = {genre: i for i, genre in enumerate(self.genres)}
+            song_genre = df['genre_cluster'].map(genre_ids).astype(float).fillna(-1).to_numpy(dtype=int)
+            genre_counts = np.bincount(flat, weights=song_genre == grid.ravel()[flat], minlength=size * size)
+
+            # Mitjanes quantitzades a uint8 (valor * 250); 255 = cel·la sense cançons
+            def quantize(values):
+                return np.where(counts > 0, np.round(values * 250), 255).astype(np.uint8)
+
+            index.update({
+                'counts': self._encode_array(np.minimum(counts, 65535).astype(np.uint16)),
+                'genre_counts': self._encode_array(np.minimum(genre_counts, 65535).astype(np.uint16)),
+                'valence': self._encode_array(quantize(mean_valence)),
+                'energy': self._encode_array(quantize(mean_energy)),
+            })
+
+        with open(os.path.join(output_dir, 'genre_index.json'), 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
         
     def plot_elements(self, dpi=300, figsize=None, margins=None, output_dir=None):
         if output_dir is None:
@@ -199,6 +409,12 @@ class GenreKDEVisualizer:
 
 
     def plot_base_layer(self, img, alpha, dpi, figsize, margins, output_dir):
+        if self.renderer == 'raster':
+            rgba = np.dstack([img, alpha])
+            canvas = raster_writer.compose_layer(rgba, figsize, dpi, margins, interpolation='bilinear')
+            raster_writer.write_png(canvas, os.path.join(output_dir, "genre_map_data.png"), dpi=dpi)
+            return
+
         fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
         ax.imshow(np.clip(img, 0, 1), extent=(0, 1, 0, 1), origin='lower', alpha=np.clip(alpha, 0, 1), interpolation='bilinear')
         ax.set_xlim(0, 1)
@@ -251,16 +467,15 @@ class GenreKDEVisualizer:
         fig.savefig(output_path, transparent=True)
         plt.close(fig)
 
-    def plot_all_layers(self, kdes_path, output_dir):
-        if not os.path.exists(kdes_path):
+    def plot_all_layers(self, frame, output_dir):
+        if not self.kde_store.has_frame(frame):
             return
         
         os.makedirs(output_dir, exist_ok=True)
-        loaded = np.load(kdes_path, allow_pickle=True)
-        kdes = loaded['kdes'].item()
+        kdes = self.kde_store.load_frame(frame)
 
         if not kdes:
-            print(f"No s'han carregat KDEs des de {kdes_path}")
+            print(f"No s'han carregat KDEs del frame {frame}")
             return
 
         for genre in self.genre_color_map:
@@ -281,6 +496,13 @@ class GenreKDEVisualizer:
 
         figsize = (8, 6)
         dpi = 300
+        if self.renderer == 'raster':
+            # matplotlib amplia aquestes capes sense suavitzar (factor > 3)
+            margins = dict(left=0.1, right=0.8, top=0.9, bottom=0.1)
+            canvas = raster_writer.compose_layer(rgba, figsize, dpi, margins, interpolation='nearest')
+            raster_writer.write_png(canvas, save_path, dpi=dpi)
+            return
+
         fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
         ax.imshow(rgba, extent=(0, 1, 0, 1), origin='lower')
         ax.axis('off')
@@ -294,20 +516,12 @@ class GenreKDEVisualizer:
         name = name.strip('_')
         return name
     
-    def spline_interpolate_kdes(self, kde_dicts, decades, target_year, threshold=0.05, d1=None, step=None):
-        if d1 == None or step == None:
-            print("S'ha d'especificar d1 i step")
-            return
-        
-        filename = f'data/kdes_data/kdes_genres_{int(d1)}_{step}.npz'
-
-        if os.path.exists(filename):
-            return
-        
-        interpolated = {}
+    def _fit_genre_splines(self, kde_dicts, decades):
+        # Ajusta un únic spline per gènere sobre tota la pila (num_decades, H, W)
+        splines = {}
         all_genres = set().union(*[k.keys() for k in kde_dicts])
 
-        for genre in all_genres:
+        for genre in sorted(all_genres):
             # Agafa tots els KDEs per aquest gènere en ordre de dècada
             kde_stack = []
             available_decades = []
@@ -318,21 +532,82 @@ class GenreKDEVisualizer:
 
             if len(kde_stack) < 2:
                 continue  # No es pot interpolar
-            
+
             kde_stack = np.array(kde_stack)  # shape: (num_decades, H, W)
+            splines[genre] = CubicSpline(available_decades, kde_stack, axis=0, extrapolate=True)
+
+        return splines
 
-            # Interpolem cada punt del grid
-            H, W = kde_stack.shape[1], kde_stack.shape[2]
-            interp_kde = np.zeros((H, W))
+    def _interpolate_frames(self, splines, target_years, threshold=0.05):
+        # Avalua els splines ja ajustats a tots els anys objectiu d'una sola vegada
+        target_years = np.asarray(target_years, dtype=float)
+        frames = [{} for _ in target_years]
 
-            for i in range(H):
-                for j in range(W):
-                    y_values = kde_stack[:, i, j]
-                    cs = CubicSpline(available_decades, y_values, extrapolate=True)
-                    interp_kde[i, j] = cs(target_year)
+        for genre, cs in splines.items():
+            interp_kdes = cs(target_years)  # shape: (num_frames, H, W)
 
             # Tallem valors negatius i fem threshold
-            interp_kde = np.where(interp_kde >= threshold, interp_kde, 0.0)
-            interpolated[genre] = interp_kde
+            interp_kdes = np.where(interp_kdes >= threshold, interp_kdes, 0.0)
+            for frame, interp_kde in zip(frames, interp_kdes):
+                frame[genre] = interp_kde
+
+        return frames
+
+    def spline_interpolate_kdes(self, kde_dicts, decades, target_year, threshold=0.05, d1=None, step=None):
+        if d1 == None or step == None:
+            print("S'ha d'especificar d1 i step")
+            return
+        
+        frame = interpolated_frame(d1, step)
+
+        cache_key = self._interpolation_cache_key(self._kde_stack_digest(kde_dicts, decades), target_year, threshold)
+        if self._artifact_ready(cache_key, frame):
+            return
+        
+        splines = self._fit_genre_splines(kde_dicts, decades)
+        interpolated = self._interpolate_frames(splines, [target_year], threshold)[0]
         
-        np.savez(filename, kdes=interpolated)
\ No newline at end of file
+        self._save_kdes(cache_key, frame, interpolated)
+
+    def _kde_stack_digest(self, kde_dicts, decades):
+        if self.cache is None:
+            return None
+        return self.cache.key('kde_stack', list(kde_dicts), [float(d) for d in decades])
+
+    def _interpolation_cache_key(self, stack_digest, target_year, threshold):
+        if stack_digest is None:
+            return None
+        return self.cache.key('interpolated_frame', stack_digest, float(target_year), threshold)
+
+    def spline_interpolate_all_kdes(self, kde_dicts, decades, num_interpolated_frames=5, threshold=0.05, segments=None):
+        # Genera tots els frames interpolats entre dècades consecutives amb una sola crida.
+        # 'segments' permet limitar-ho a alguns trams (índex de la dècada inicial).
+        if segments is None:
+            segments = range(len(decades) - 1)
+
+        stack_digest = self._kde_stack_digest(kde_dicts, decades)
+
+        targets = []
+        for i in segments:
+            d1 = decades[i]
+            d2 = decades[i + 1]
+
+            for step in range(1, num_interpolated_frames + 1):
+                frame = interpolated_frame(d1, step)
+                alpha = step / (num_interpolated_frames + 1)
+                interpolated_year = (1 - alpha) * d1 + alpha * d2
+
+                cache_key = self._interpolation_cache_key(stack_digest, interpolated_year, threshold)
+                if self._artifact_ready(cache_key, frame):
+                    continue
+                targets.append((interpolated_year, frame, cache_key))
+
+        if not targets:
+            return
+
+        # Els coeficients del spline es reutilitzen per a tots els anys objectiu
+        splines = self._fit_genre_splines(kde_dicts, decades)
+        frames = self._interpolate_frames(splines, [year for year, _, _ in targets], threshold)
+
+        for (_, frame, cache_key), interpolated in zip(targets, frames):
+            self._save_kdes(cache_key, frame, interpolated)
@@ -0,0 +1,296 @@
+import functools
+import glob
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Variables d'entorn que activen la instrumentació (també es pot activar amb enable())
+TRACE_ENV = 'VIS_TRACE'
+TRACE_MEMORY_ENV = 'VIS_TRACE_MEMORY'
+
+_tracer = None
+
+
+def _peak_rss():
+    # Pic de memòria resident del procés (ru_maxrss és en KB a Linux i en bytes a macOS)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if os.uname().sysname == 'Darwin' else rss * 1024
+
+
+class Tracer():
+    """
+    Registre de spans (temps d'inici i durada, niats per fil) i comptadors.
+    Cada procés escriu els seus esdeveniments a 'trace_dir/events.<pid>.jsonl' quan es tanca
+    un span de primer nivell, de manera que els processos del pool no es perden.
+    """
+    def __init__(self, trace_dir, memory=False):
+        self.trace_dir = trace_dir
+        self.memory = memory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._reset_process()
+
+    def _reset_process(self):
+        # Després d'un fork el fill no ha d'heretar els esdeveniments pendents del pare
+        self.pid = os.getpid()
+        self._events = []
+        self._local = threading.local()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        if os.getpid() != self.pid:
+            self._reset_process()
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, name):
+        stack = self._stack()
+        stack.append((name, time.perf_counter(), time.time()))
+
+    def end(self, args=None):
+        stack = self._stack()
+        name, start, wall_start = stack.pop()
+        event = {
+            'name': name,
+            'ts': wall_start,
+            'dur': time.perf_counter() - start,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+            'depth': len(stack),
+            'peak_rss': _peak_rss(),
+        }
+        if self.memory:
+            event['traced_current'], event['traced_peak'] = tracemalloc.get_traced_memory()
+        if args:
+            event['args'] = args
+
+        with self._lock:
+            self._events.append(event)
+            if not stack:
+                self.flush()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._events.append({
+                'counter': name,
+                'value': value,
+                'ts': time.time(),
+                'pid': os.getpid(),
+            })
+
+    def flush(self):
+        if not self._events:
+            return
+        os.makedirs(self.trace_dir, exist_ok=True)
+        with open(os.path.join(self.trace_dir, f'events.{self.pid}.jsonl'), 'a') as f:
+            for event in self._events:
+                f.write(json.dumps(event) + '\n')
+        self._events = []
+
+
+def enabled():
+    return _tracer is not None
+
+
+def enable(trace_dir='data/trace', memory=False):
+    """
+    Activa la instrumentació: esborra els esdeveniments d'execucions anteriors i embolcalla
+    les etapes del pipeline. Mentre no s'activa, el codi no es modifica i no té cap cost.
+    """
+    global _tracer
+    if _tracer is not None:
+        return _tracer
+    for path in glob.glob(os.path.join(trace_dir, 'events.*.jsonl')):
+        os.remove(path)
+    _tracer = Tracer(trace_dir, memory)
+    _instrument_pipeline()
+    return _tracer
+
+
+def enable_from_env(argv=()):
+    # Activa la instrumentació si ho demana l'entorn (VIS_TRACE=1) o la línia d'ordres (--trace)
+    memory = os.environ.get(TRACE_MEMORY_ENV, '') not in ('', '0') or '--trace-memory' in argv
+    if os.environ.get(TRACE_ENV, '') not in ('', '0') or '--trace' in argv or memory:
+        return enable(memory=memory)
+    return None
+
+
+def worker_config():
+    # Configuració per tornar a activar la instrumentació als processos del pool (spawn)
+    if _tracer is None:
+        return None
+    return {'trace_dir': _tracer.trace_dir, 'memory': _tracer.memory}
+
+
+def init_worker(config):
+    global _tracer
+    if config is None or _tracer is not None:
+        return
+    _tracer = Tracer(config['trace_dir'], config['memory'])
+    _instrument_pipeline()
+
+
+def count(name, value=1):
+    if _tracer is not None:
+        _tracer.count(name, value)
+
+
+def traced(fn, name=None, counters=None):
+    """
+    Embolcalla 'fn' amb un span. 'counters(result, *args, **kwargs)' retorna els comptadors
+    a sumar després de cada crida.
+    """
+    name = name or fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _tracer.begin(name)
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            _tracer.end()
+        if counters is not None:
+            for counter, value in counters(result, *args, **kwargs).items():
+                _tracer.count(counter, value)
+        return result
+
+    wrapper.__wrapped_by_tracer__ = True
+    return wrapper
+
+
+def _patch(owner, attr, counters=None, name=None):
+    fn = owner.__dict__[attr] if isinstance(owner, type) else getattr(owner, attr)
+    if getattr(fn, '__wrapped_by_tracer__', False):
+        return
+    if isinstance(fn, staticmethod):
+        return
+    name = name or f'{getattr(owner, "__name__", owner)}.{attr}'
+    setattr(owner, attr, traced(fn, name, counters))
+
+
+def _file_bytes(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+
+def _instrument_pipeline():
+    # Importació tardana: aquest mòdul no depèn del pipeline si no s'activa
+    import matplotlib.figure
+    import data_processor
+    import data_summarizer
+    import genre_kde_plots
+    import k_means
+    import raster_writer
+    import render_scheduler
+
+    _patch(data_processor.DataProcessor, 'preprocess_data')
+    _patch(data_processor.DataProcessor, '_simplify_genres')
+    _patch(data_processor.DataProcessor, '_remove_outliers_iqr')
+    _patch(k_means, 'get_clusters_df', name='k_means.get_clusters_df')
+    _patch(data_summarizer.Summarizer, 'summarize_genres')
+
+    # Tots els mètodes del visualitzador, amb el nombre de punts del grid avaluats
+    visualizer = genre_kde_plots.GenreKDEVisualizer
+    grid_points = {
+        '_evaluate_kde_exact': lambda result, self, kde: {
+            'grid_points': result.size, 'kernel_evaluations': result.size * kde.n
+        },
+        '_evaluate_kde_fft': lambda result, self, kde: {'grid_points': result.size},
+    }
+    for attr, value in list(vars(visualizer).items()):
+        if callable(value) and not attr.startswith('__'):
+            _patch(visualizer, attr, counters=grid_points.get(attr))
+
+    # Fitxers escrits i figures renderitzades
+    _patch(raster_writer, 'compose_layer', name='raster_writer.compose_layer')
+    _patch(raster_writer, 'write_png', name='raster_writer.write_png',
+           counters=lambda result, canvas, path, **kw: {'figures_rendered': 1, 'bytes_written': _file_bytes(path)})
+    _patch(matplotlib.figure.Figure, 'savefig', name='Figure.savefig',
+           counters=lambda result, fig, path, *a, **kw: {
+               'figures_rendered': 1, 'bytes_written': _file_bytes(path) if isinstance(path, str) else 0
+           })
+    # write_table s'importa amb 'from table_io import ...': s'embolcalla a cada mòdul que la fa servir
+    for module in (data_processor, k_means):
+        _patch(module, 'write_table', name='table_io.write_table',
+               counters=lambda result, df, path: {'bytes_written': _file_bytes(path)})
+
+    # Tasques del pool de renderitzat: són els spans de primer nivell de cada procés
+    for attr in ('_render_elements', '_render_decade', '_interpolate_segment', '_render_segment_maps',
+                 '_render_frame_layers'):
+        _patch(render_scheduler, attr, name=f'render_scheduler.{attr}')
+    _patch(render_scheduler.RenderScheduler, 'run')
+
+
+def _load_events(trace_dir):
+    events = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, 'events.*.jsonl'))):
+        with open(path) as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    return events
+
+
+def write_trace(trace_dir=None):
+    """
+    Ajunta els esdeveniments de tots els processos i escriu 'trace.json' (resum per span,
+    comptadors totals i esdeveniments) i 'trace.chrome.json' (format de chrome://tracing / Perfetto).
+    """
+    if _tracer is None:
+        return None
+    _tracer.flush()
+    trace_dir = trace_dir or _tracer.trace_dir
+    events = _load_events(_tracer.trace_dir)
+
+    spans = [event for event in events if 'name' in event]
+    counts = [event for event in events if 'counter' in event]
+
+    summary = {}
+    for span in spans:
+        entry = summary.setdefault(span['name'], {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        entry['calls'] += 1
+        entry['total_seconds'] += span['dur']
+        entry['max_seconds'] = max(entry['max_seconds'], span['dur'])
+
+    counters = {}
+    for event in counts:
+        counters[event['counter']] = counters.get(event['counter'], 0) + event['value']
+
+    trace = {
+        'summary': dict(sorted(summary.items(), key=lambda item: -item[1]['total_seconds'])),
+        'counters': counters,
+        'peak_rss': max((span['peak_rss'] or 0 for span in spans), default=None),
+        'spans': spans,
+    }
+    os.makedirs(trace_dir, exist_ok=True)
+    with open(os.path.join(trace_dir, 'trace.json'), 'w') as f:
+        json.dump(trace, f, indent=4)
+
+    # Chrome trace: spans complets ('X') i comptadors acumulats ('C'), en microsegons
+    origin = min((event['ts'] for event in events), default=0)
+    chrome_events = []
+    for span in spans:
+        args = dict(span.get('args', {}), peak_rss=span['peak_rss'])
+        if 'traced_peak' in span:
+            args.update(traced_current=span['traced_current'], traced_peak=span['traced_peak'])
+        chrome_events.append({
+            'name': span['name'], 'cat': span['name'].split('.')[0], 'ph': 'X',
+            'ts': (span['ts'] - origin) * 1e6, 'dur': span['dur'] * 1e6,
+            'pid': span['pid'], 'tid': span['tid'], 'args': args,
+        })
+    totals = {}
+    for event in sorted(counts, key=lambda event: event['ts']):
+        totals[event['counter']] = totals.get(event['counter'], 0) + event['value']
+        chrome_events.append({
+            'name': event['counter'], 'ph': 'C', 'ts': (event['ts'] - origin) * 1e6,
+            'pid': event['pid'], 'args': {event['counter']: totals[event['counter']]},
+        })
+    with open(os.path.join(trace_dir, 'trace.chrome.json'), 'w') as f:
+        json.dump({'traceEvents': chrome_events, 'displayTimeUnit': 'ms'}, f)
+
+    return trace
@@ -4,6 +4,7 @@ from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import silhouette_score
+from table_io import read_table, write_table
 
 def plot_elbow(X):
     inertia = []
@@ -35,17 +36,43 @@ def plot_silhouette(X):
     plt.grid(True)
     plt.show()
 
-def get_clusters_df(df, plot_bool, processed_path, k_means_file):
-    if os.path.exists(k_means_file):
+# Assignació de noms als clusters manualment
+cluster_to_name = {
+    0: 'Urban & Latin',
+    1: 'Indie / Asian / Jazz',
+    2: 'Classical',
+    3: 'Metal',
+    4: 'Pop & Rock',
+    5: 'Folk & Country',
+    6: 'Electronic'
+}
+
+def get_clusters_df(df, plot_bool, processed_path, k_means_file, cache=None):
+    k = 7
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(
+            'k_means',
+            cache.file_digest(processed_path),
+            {
+                'k': k,
+                'random_state': 42,
+                'cluster_to_name': cluster_to_name,
+                'format': os.path.splitext(k_means_file)[1],
+            }
+        )
+        if cache.fetch(cache_key, k_means_file):
+            print(f"Recuperat progrés des de {k_means_file}")
+            return read_table(k_means_file)
+    elif os.path.exists(k_means_file):
         print(f"Recuperat progrés des de {k_means_file}")
-        return pd.read_csv(k_means_file)
+        return read_table(k_means_file)
     
-    df = pd.read_csv(processed_path)
+    df = read_table(processed_path)
     # 1. Calcular mitjanes de valence i energy per grup de gènere
-    genre_summary = df.groupby('genre_group')[['valence', 'energy']].mean().reset_index()
+    genre_summary = df.groupby('genre_group', observed=True)[['valence', 'energy']].mean().reset_index()
 
     # 2. Aplicar KMeans
-    k = 7
     kmeans = KMeans(n_clusters=k, random_state=42)
     genre_summary['cluster'] = kmeans.fit_predict(genre_summary[['valence', 'energy']])
 
@@ -54,23 +81,15 @@ def get_clusters_df(df, plot_bool, processed_path, k_means_file):
         cluster_genres = genre_summary[genre_summary['cluster'] == cluster_id]['genre_group'].tolist()
         print(f"Cluster {cluster_id}: {cluster_genres}")
 
-    # 3. Assignació de noms als clusters manualment
-    cluster_to_name = {
-        0: 'Urban & Latin',
-        1: 'Indie / Asian / Jazz',
-        2: 'Classical',
-        3: 'Metal',
-        4: 'Pop & Rock',
-        5: 'Folk & Country',
-        6: 'Electronic'
-    }
-
+    # 3. Noms dels clusters
     genre_summary['genre_cluster'] = genre_summary['cluster'].map(cluster_to_name)
 
     # 4. Merge amb el DataFrame original
     df = df.merge(genre_summary[['genre_group', 'genre_cluster']], on='genre_group', how='left')
 
-    df.to_csv(k_means_file, index=False)
+    write_table(df, k_means_file)
+    if cache_key is not None:
+        cache.store(cache_key, k_means_file)
 
     if not plot_bool:
         return df
@@ -0,0 +1,151 @@
+import json
+import os
+import numpy as np
+
+
+def decade_frame(decade):
+    return str(int(decade))
+
+
+def interpolated_frame(d1, step):
+    return f'{int(d1)}_{step}'
+
+
+def frame_names(decades, num_interpolated_frames):
+    # Ordre dels frames de l'animació: dècada, interpolats fins a la següent dècada, ...
+    frames = []
+    for i, decade in enumerate(decades):
+        frames.append(decade_frame(decade))
+        if i < len(decades) - 1:
+            for step in range(1, num_interpolated_frames + 1):
+                frames.append(interpolated_frame(decade, step))
+    return frames
+
+
+class KDEStore():
+    """
+    Magatzem en disc de totes les densitats KDE com un cub (frame, gènere, H, W).
+    Les dades es guarden en .npy obert amb memmap (sense pickle) i un índex JSON
+    amb els noms de gèneres i frames. Es pot quantitzar a uint8/uint16.
+    """
+    dtypes = {
+        'float32': np.float32,
+        'uint16': np.uint16,
+        'uint8': np.uint8,
+    }
+
+    def __init__(self, path_prefix='data/kdes_data/kdes_cube', dtype='float32'):
+        if dtype not in self.dtypes:
+            raise ValueError(f"Tipus de dades desconegut: {dtype}. Opcions: {list(self.dtypes)}")
+        self.path_prefix = path_prefix
+        self.dtype = dtype
+        self.index_path = f'{path_prefix}.json'
+        self.cube_path = f'{path_prefix}.npy'
+        self.present_path = f'{path_prefix}_present.npy'
+        self.written_path = f'{path_prefix}_written.npy'
+        self._reset()
+
+    def _reset(self):
+        self.index = None
+        self._cube = None
+        self._present = None
+        self._written = None
+        self._mode = None
+
+    def __getstate__(self):
+        # Els memmaps no es copien entre processos: cada procés els torna a obrir
+        state = self.__dict__.copy()
+        state.update(index=None, _cube=None, _present=None, _written=None, _mode=None)
+        return state
+
+    def _scale(self):
+        if self.dtype == 'float32':
+            return None
+        return float(np.iinfo(self.dtypes[self.dtype]).max)
+
+    def prepare(self, genres, frames, resolution):
+        # Crea el cub si no existeix o si no correspon als paràmetres actuals
+        index = {
+            'genres': list(genres),
+            'frames': list(frames),
+            'resolution': int(resolution),
+            'dtype': self.dtype,
+        }
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                if json.load(f) == index and os.path.exists(self.cube_path):
+                    return
+
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        shape = (len(frames), len(genres), resolution, resolution)
+        np.lib.format.open_memmap(self.cube_path, mode='w+', dtype=self.dtypes[self.dtype], shape=shape).flush()
+        np.lib.format.open_memmap(self.present_path, mode='w+', dtype=np.uint8, shape=shape[:2]).flush()
+        np.lib.format.open_memmap(self.written_path, mode='w+', dtype=np.uint8, shape=shape[:1]).flush()
+        with open(self.index_path, 'w') as f:
+            json.dump(index, f, indent=4)
+        self._reset()
+
+    def _open(self, mode='r'):
+        if self._mode == mode or self._mode == 'r+':
+            return
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No existeix el magatzem de KDEs: {self.index_path}")
+        with open(self.index_path, 'r') as f:
+            self.index = json.load(f)
+        self._cube = np.load(self.cube_path, mmap_mode=mode)
+        self._present = np.load(self.present_path, mmap_mode=mode)
+        self._written = np.load(self.written_path, mmap_mode=mode)
+        self._mode = mode
+
+    def _frame_idx(self, frame):
+        return self.index['frames'].index(frame)
+
+    def has_frame(self, frame):
+        if not os.path.exists(self.index_path):
+            return False
+        self._open('r')
+        return frame in self.index['frames'] and bool(self._written[self._frame_idx(frame)])
+
+    def load_frame(self, frame):
+        # Retorna {gènere: densitat} només per als gèneres presents al frame
+        self._open('r')
+        f = self._frame_idx(frame)
+        scale = self._scale()
+        kde_dict = {}
+        for g, genre in enumerate(self.index['genres']):
+            if not self._present[f, g]:
+                continue
+            density = self._cube[f, g]
+            kde_dict[genre] = density if scale is None else density.astype(np.float32) / scale
+        return kde_dict
+
+    def load_frames(self, frames):
+        # Cub (frames, gèneres, H, W); si els frames són consecutius és una vista sense còpia
+        self._open('r')
+        idx = [self._frame_idx(frame) for frame in frames]
+        if idx == list(range(idx[0], idx[0] + len(idx))):
+            cube = self._cube[idx[0]:idx[0] + len(idx)]
+        else:
+            cube = self._cube[idx]
+
+        scale = self._scale()
+        return cube if scale is None else cube.astype(np.float32) / scale
+
+    def save_frame(self, frame, kde_dict):
+        self._open('r+')
+        f = self._frame_idx(frame)
+        scale = self._scale()
+        for g, genre in enumerate(self.index['genres']):
+            if genre in kde_dict:
+                density = kde_dict[genre]
+                if scale is not None:
+                    density = np.round(np.clip(density, 0, 1) * scale)
+                self._cube[f, g] = density
+                self._present[f, g] = 1
+            else:
+                self._cube[f, g] = 0
+                self._present[f, g] = 0
+        self._cube.flush()
+        self._present.flush()
+        self._written[f] = 1
+        self._written.flush()
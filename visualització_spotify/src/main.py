@@ -1,66 +1,62 @@
+from artifact_cache import ArtifactCache
 from data_processor import DataProcessor
 from data_summarizer import Summarizer
 from genre_kde_plots import GenreKDEVisualizer
+from render_scheduler import RenderScheduler
+from sampler import ReservoirSampler
+import instrumentation
 import k_means
-import numpy as np
+import web_export
+import os
+import sys
 
 if __name__ == '__main__':
-    original_dataset_path = 'data/input_data.csv'
-    processed_path = 'data/processed_data.csv'
-
-    preprocessor = DataProcessor()
-    df = preprocessor.preprocess_data(original_dataset_path, processed_path)
+    # Temps i memòria de cada etapa: VIS_TRACE=1 o --trace (--trace-memory afegeix tracemalloc).
+    # El resultat queda a data/trace/trace.json i data/trace/trace.chrome.json
+    instrumentation.enable_from_env(sys.argv)
 
-    k_means_file = 'data/k_means_df.csv'
-    df = k_means.get_clusters_df(df, True, processed_path, k_means_file)
+    # Format dels fitxers intermedis: 'csv' o 'parquet' (columnar, conserva els tipus)
+    data_format = 'parquet'
 
-    summarizer = Summarizer()
-    summarizer.summarize_genres(df, 'data/genres_summary.json')
+    original_dataset_path = 'data/input_data.csv'
+    processed_path = f'data/processed_data.{data_format}'
 
-    visualizer = GenreKDEVisualizer(df)
-    visualizer.plot_elements(output_dir='plots/common')
+    # Cache d'artefactes intermedis indexada pel hash de les entrades i paràmetres
+    cache = ArtifactCache('data/cache')
 
-    decades = sorted(df['decade'].unique())
-    # Generació mapes kde
-    for decade in decades:
-        decade_str = str(int(decade))
-        subset = df[df['decade'] == decade]
-        visualizer.plot_decorators(output_dir=f'plots/{decade_str}', decade=decade_str)
-        visualizer.plot_dominant_map(subset, f'data/kdes_data/kdes_genres_{decade_str}.npz', f'plots/{decade_str}')
-        visualizer.plot_all_layers(f'data/kdes_data/kdes_genres_{decade_str}.npz', f'plots/{decade_str}')
+    # Mostra de 10000 cançons estratificada per dècada i grup, perquè les dècades amb poques
+    # cançons (com els 80) tinguin prou punts per als KDEs
+    sampler = ReservoirSampler(10000, seed=42, strata=['decade', 'genre_group'], min_per_stratum=40)
 
-    # Generació mapes kde interpolats
-    decades = sorted(df['decade'].unique())
-    kde_dicts = []
+    preprocessor = DataProcessor(cache=cache, sampler=sampler)
+    df = preprocessor.preprocess_data(original_dataset_path, processed_path)
 
-    for d in decades:
-        kde = np.load(f'data/kdes_data/kdes_genres_{int(d)}.npz', allow_pickle=True)['kdes'][()]
-        kde_dicts.append(kde)
+    k_means_file = f'data/k_means_df.{data_format}'
+    df = k_means.get_clusters_df(df, True, processed_path, k_means_file, cache=cache)
 
     num_interpolated_frames = 5
 
-    for i in range(len(decades) - 1):
-        d1 = decades[i]
-        d2 = decades[i + 1]
+    # Resum per gènere i dècada, amb les estadístiques de cada pas de l'animació
+    summarizer = Summarizer()
+    summarizer.summarize_genres(df, 'data/genres_summary.json', num_interpolated_frames=num_interpolated_frames)
+
+    # Les capes de dades s'escriuen directament a PNG sense crear figures de matplotlib
+    visualizer = GenreKDEVisualizer(df, cache=cache, renderer='raster')
+
+    # Nombre de processos per generar KDEs, interpolacions i imatges (1 = seqüencial)
+    num_workers = os.cpu_count()
 
-        for step in range(1, num_interpolated_frames + 1):
-            alpha = step / (num_interpolated_frames + 1)
-            interpolated_year = (1 - alpha) * d1 + alpha * d2
+    scheduler = RenderScheduler(visualizer, max_workers=num_workers)
+    scheduler.run(df, num_interpolated_frames=num_interpolated_frames, threshold=0.4)
 
-            visualizer.spline_interpolate_kdes(
-                kde_dicts=kde_dicts,
-                decades=decades,
-                target_year=interpolated_year,
-                threshold=0.4,
-                d1=d1,
-                step=step
-            )
+    # Capes per publicar a img/: PNG amb paleta i WebP, amb un manifest de mides i hashes.
+    # 'web_width' redueix l'amplada de les imatges (None = la resolució original)
+    web_formats = ('png', 'webp')
+    web_width = None
+    web_export.export_web_assets('plots', 'plots_web', formats=web_formats, width=web_width, max_workers=num_workers)
 
-    for i in range(len(decades) - 1):
-        d1 = decades[i]
+    # Un sprite sheet per tipus de capa amb tots els frames de l'animació (i la decoració
+    # com a fons comú més el text de cada dècada), amb les posicions a atlas.json
+    web_export.export_atlases('plots', 'plots_web', fmt='webp', width=1200)
 
-        for step in range(1, num_interpolated_frames + 1):
-            kde_path = f'data/kdes_data/kdes_genres_{int(d1)}_{step}.npz'
-            output_folder = f'plots/{int(d1)}/interpolated_{step}'
-            visualizer.plot_dominant_map(None, kde_path, output_folder)
-            visualizer.plot_all_layers(kde_path, output_folder)
\ No newline at end of file
+    instrumentation.write_trace()
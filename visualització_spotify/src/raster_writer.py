@@ -0,0 +1,49 @@
+import numpy as np
+from PIL import Image
+
+
+def axes_box(figsize, dpi, margins, image_aspect=1.0):
+    """
+    Posició en píxels (x0, y0, amplada, alçada), des de la cantonada superior esquerra,
+    on matplotlib dibuixa una imatge amb extent (0, 1, 0, 1) i aspect='equal'.
+    """
+    fig_w = int(round(figsize[0] * dpi))
+    fig_h = int(round(figsize[1] * dpi))
+
+    ax_w = (margins['right'] - margins['left']) * fig_w
+    ax_h = (margins['top'] - margins['bottom']) * fig_h
+
+    # Amb aspect 'equal' l'eix es redueix i queda centrat dins l'espai dels marges
+    box_w = min(ax_w, ax_h / image_aspect)
+    box_h = box_w * image_aspect
+    x0 = margins['left'] * fig_w + (ax_w - box_w) / 2
+    y0 = fig_h - (margins['bottom'] * fig_h + (ax_h - box_h) / 2 + box_h)
+
+    return int(round(x0)), int(round(y0)), int(round(box_w)), int(round(box_h))
+
+
+def compose_layer(rgba, figsize, dpi, margins, interpolation='bilinear', origin='lower'):
+    # Col·loca la imatge RGBA (valors 0-1) en un llenç transparent de la mida final
+    fig_w = int(round(figsize[0] * dpi))
+    fig_h = int(round(figsize[1] * dpi))
+    x0, y0, box_w, box_h = axes_box(figsize, dpi, margins, rgba.shape[0] / rgba.shape[1])
+
+    resample = {'bilinear': Image.BILINEAR, 'nearest': Image.NEAREST}.get(interpolation)
+    if resample is None:
+        raise ValueError(f"Interpolació desconeguda: {interpolation}")
+
+    rgba = np.clip(rgba, 0, 1)
+    if origin == 'lower':
+        rgba = rgba[::-1]
+
+    # L'ampliació es fa amb colors premultiplicats per l'alpha ('RGBa'), com matplotlib
+    layer = Image.fromarray(np.round(rgba * 255).astype(np.uint8), mode='RGBA')
+    layer = layer.convert('RGBa').resize((box_w, box_h), resample).convert('RGBA')
+
+    canvas = Image.new('RGBA', (fig_w, fig_h))
+    canvas.paste(layer, (x0, y0))
+    return canvas
+
+
+def write_png(canvas, path, dpi=300, compress_level=6):
+    canvas.save(path, format='PNG', dpi=(dpi, dpi), compress_level=compress_level)
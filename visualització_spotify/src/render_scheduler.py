@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from kde_store import decade_frame, frame_names, interpolated_frame
+import instrumentation
+
+# Visualitzador compartit per cada procés del pool (s'inicialitza un cop per procés)
+_visualizer = None
+
+
+def _init_worker(visualizer, trace_config=None):
+    global _visualizer
+    _visualizer = visualizer
+    instrumentation.init_worker(trace_config)
+
+
+def _render_elements(output_dir):
+    _visualizer.plot_elements(output_dir=output_dir)
+
+
+def _render_decade(subset, decade_str, output_dir):
+    # Calcula els KDEs de la dècada i en genera totes les capes
+    _visualizer.plot_decorators(output_dir=output_dir, decade=decade_str)
+    _visualizer.plot_dominant_map(subset, decade_str, output_dir)
+    _visualizer.plot_all_layers(decade_str, output_dir)
+
+
+def _interpolate_segment(decades, num_interpolated_frames, threshold, segment):
+    # Les KDEs de les dècades es llegeixen del cub amb memmap dins de cada procés
+    kde_dicts = [_visualizer.kde_store.load_frame(decade_frame(d)) for d in decades]
+    _visualizer.spline_interpolate_all_kdes(
+        kde_dicts=kde_dicts,
+        decades=decades,
+        num_interpolated_frames=num_interpolated_frames,
+        threshold=threshold,
+        segments=[segment]
+    )
+    return segment
+
+
+def _render_segment_maps(frames, output_dirs):
+    # Mapes dominants de tots els frames d'un tram en un sol pas vectoritzat
+    _visualizer.plot_dominant_maps(frames, output_dirs)
+
+
+def _render_frame_layers(frame, output_dir):
+    _visualizer.plot_all_layers(frame, output_dir)
+
+
+class _SerialExecutor():
+    # Executa les tasques al mateix procés (mateixa interfície que el pool)
+    def __init__(self, visualizer):
+        _init_worker(visualizer)
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class RenderScheduler():
+    def __init__(self, visualizer, max_workers=None):
+        self.visualizer = visualizer
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _executor(self):
+        if self.max_workers == 1:
+            return _SerialExecutor(self.visualizer)
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self.visualizer, instrumentation.worker_config())
+        )
+
+    def run(self, df, num_interpolated_frames=5, threshold=0.4):
+        decades = sorted(df['decade'].unique())
+
+        # El cub de KDEs es crea abans de repartir la feina entre processos
+        self.visualizer.prepare_kde_store(frame_names(decades, num_interpolated_frames))
+
+        with self._executor() as executor:
+            # 1. KDEs i capes de cada dècada (independents entre si)
+            futures = [executor.submit(_render_elements, 'plots/common')]
+            for decade in decades:
+                decade_str = decade_frame(decade)
+                subset = df[df['decade'] == decade]
+                futures.append(executor.submit(_render_decade, subset, decade_str, f'plots/{decade_str}'))
+
+            # La interpolació necessita tots els KDEs de les dècades
+            for future in futures:
+                future.result()
+
+            # 2. Interpolació per trams entre dècades consecutives
+            segment_futures = [
+                executor.submit(_interpolate_segment, decades, num_interpolated_frames, threshold, i)
+                for i in range(len(decades) - 1)
+            ]
+
+            # 3. Cada tram es renderitza tan bon punt té els seus frames interpolats
+            frame_futures = []
+            for future in as_completed(segment_futures):
+                d1 = decades[future.result()]
+                steps = range(1, num_interpolated_frames + 1)
+                frames = [interpolated_frame(d1, step) for step in steps]
+                output_dirs = [f'plots/{int(d1)}/interpolated_{step}' for step in steps]
+
+                frame_futures.append(executor.submit(_render_segment_maps, frames, output_dirs))
+                for frame, output_dir in zip(frames, output_dirs):
+                    frame_futures.append(executor.submit(_render_frame_layers, frame, output_dir))
+
+            for future in frame_futures:
+                future.result()
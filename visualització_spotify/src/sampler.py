@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+
+class ReservoirSampler:
+    """
+    Mostreig reproduïble per trossos: cada fila rep una clau aleatòria (generador amb llavor)
+    i es conserven les claus més petites, que equival a una mostra uniforme sense reemplaçament.
+    Amb 'strata' es guarda un reservori per estrat i al final es reparteix la mida de la mostra
+    proporcionalment, amb un mínim de 'min_per_stratum' files per estrat.
+    La memòria depèn de la mida de la mostra i del nombre d'estrats, no de la mida de l'entrada.
+    """
+    def __init__(self, sample_size, seed=42, strata=None, min_per_stratum=0):
+        self.sample_size = sample_size
+        self.seed = seed
+        self.strata = list(strata) if strata else []
+        self.min_per_stratum = min_per_stratum
+        self.reset()
+
+    def reset(self):
+        self._rng = np.random.default_rng(self.seed)
+        self._reservoirs = {}
+        self._counts = {}
+        self._seen = 0
+
+    def params(self):
+        # Paràmetres que determinen la mostra (per a les claus de cache)
+        return {
+            'sample_size': self.sample_size,
+            'seed': self.seed,
+            'strata': self.strata,
+            'min_per_stratum': self.min_per_stratum,
+        }
+
+    def _keep_smallest(self, frame):
+        if len(frame) <= self.sample_size:
+            return frame
+        keys = frame['_key'].to_numpy()
+        return frame.iloc[np.argpartition(keys, self.sample_size - 1)[:self.sample_size]]
+
+    def add(self, chunk):
+        # Les claus se sortegen en l'ordre de les files: el resultat no depèn de la mida dels trossos
+        chunk = chunk.assign(
+            _key=self._rng.random(len(chunk)),
+            _order=np.arange(self._seen, self._seen + len(chunk))
+        )
+        self._seen += len(chunk)
+
+        if not self.strata:
+            groups = [((), chunk)]
+        else:
+            groups = chunk.groupby(self.strata, observed=True, sort=False, dropna=False)
+
+        for stratum, rows in groups:
+            self._counts[stratum] = self._counts.get(stratum, 0) + len(rows)
+            if stratum in self._reservoirs:
+                rows = pd.concat([self._reservoirs[stratum], rows])
+            self._reservoirs[stratum] = self._keep_smallest(rows)
+
+    def _quotas(self, strata):
+        counts = np.array([self._counts[s] for s in strata])
+        quotas = np.minimum(counts, self.min_per_stratum)
+
+        remaining = self.sample_size - quotas.sum()
+        spare = counts - quotas
+        if remaining > 0 and spare.sum() > 0:
+            # Repartiment proporcional amb el mètode del residu més gran
+            share = spare / spare.sum() * min(remaining, spare.sum())
+            extra = np.floor(share).astype(int)
+            leftover = int(min(remaining, spare.sum()) - extra.sum())
+            extra[np.argsort(-(share - extra), kind='stable')[:leftover]] += 1
+            quotas += np.minimum(extra, spare)
+        return quotas
+
+    def sample(self):
+        """
+        Retorna la mostra en l'ordre original de les files.
+        """
+        if not self._reservoirs:
+            return pd.DataFrame()
+
+        strata = sorted(self._reservoirs, key=str)
+        parts = []
+        for stratum, quota in zip(strata, self._quotas(strata)):
+            reservoir = self._reservoirs[stratum]
+            parts.append(reservoir.nsmallest(quota, '_key'))
+
+        sample = pd.concat(parts).sort_values('_order')
+        return sample.drop(columns=['_key', '_order'])
+
+    def sample_frame(self, df, chunksize=100_000):
+        # Mostreja un DataFrame sencer passant-lo per trossos
+        self.reset()
+        for start in range(0, len(df), chunksize):
+            self.add(df.iloc[start:start + chunksize])
+        return self.sample()
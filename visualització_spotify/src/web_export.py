@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Formats de sortida i extensió de cada un
+WEB_FORMATS = {
+    'png': '.png',             # PNG amb paleta (8 bits)
+    'webp': '.webp',           # WebP amb pèrdua
+    'webp_lossless': '.webp',  # WebP sense pèrdua
+}
+
+
+def quantize_rgba(image, colors=256):
+    """
+    Converteix una imatge RGBA a paleta. Si té com a molt 'colors' valors RGBA diferents
+    (per exemple les capes d'un sol gènere: un color amb diferents alphas) la paleta és exacta;
+    si no, es quantitza amb un octree.
+    """
+    rgba = np.asarray(image)
+    packed = rgba.view(np.uint32).reshape(rgba.shape[:2])
+    values, indices = np.unique(packed, return_inverse=True)
+
+    if len(values) > colors:
+        return image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+
+    palette = values.view(np.uint8).reshape(-1, 4)
+    quantized = Image.fromarray(indices.reshape(packed.shape).astype(np.uint8), mode='P')
+    quantized.putpalette(palette[:, :3].ravel().tolist())
+    quantized.info['transparency'] = bytes(palette[:, 3])
+    return quantized
+
+
+def resize_rgba(image, width):
+    # Canvi de mida amb colors premultiplicats per l'alpha, com a raster_writer
+    if width is None or width == image.width:
+        return image
+    height = int(round(image.height * width / image.width))
+    return image.convert('RGBa').resize((width, height), Image.LANCZOS).convert('RGBA')
+
+
+def save_web_image(image, path, fmt, quality=85, colors=256):
+    if fmt == 'png':
+        quantize_rgba(image, colors).save(path, format='PNG', optimize=True)
+    elif fmt == 'webp':
+        image.save(path, format='WEBP', quality=quality, alpha_quality=100, method=4)
+    elif fmt == 'webp_lossless':
+        image.save(path, format='WEBP', lossless=True, quality=100, method=4)
+    else:
+        raise ValueError(f"Format desconegut: {fmt}. Opcions: {list(WEB_FORMATS)}")
+
+
+def _file_entry(path, rel_path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    return {
+        'file': rel_path.replace(os.sep, '/'),
+        'bytes': len(content),
+        'hash': hashlib.sha256(content).hexdigest()[:16],
+    }
+
+
+def _export_image(src_path, dst_dir, rel_stem, formats, width, quality, colors):
+    # Escriu una capa en tots els formats demanats i en retorna les entrades del manifest
+    image = resize_rgba(Image.open(src_path).convert('RGBA'), width)
+    entries = {}
+    for fmt in formats:
+        rel_path = rel_stem + WEB_FORMATS[fmt]
+        dst_path = os.path.join(dst_dir, rel_path)
+        save_web_image(image, dst_path, fmt, quality=quality, colors=colors)
+        entries[fmt] = _file_entry(dst_path, rel_path)
+    return rel_stem.replace(os.sep, '/'), entries
+
+
+def export_web_assets(src_dir='plots', dst_dir='img', formats=('png', 'webp'), width=None, quality=85,
+                      colors=256, max_workers=None):
+    """
+    Passa les capes renderitzades a 'src_dir' a formats per al web i les deixa a 'dst_dir'
+    amb la mateixa estructura de carpetes. 'width' canvia l'amplada de sortida (None = la mateixa).
+    Els fitxers que no són PNG (com genre_index.json) es copien tal qual.
+    Escriu 'manifest.json' amb la mida i el hash de cada fitxer, que el frontend fa servir
+    per triar el format i precarregar les imatges.
+    """
+    unknown = [fmt for fmt in formats if fmt not in WEB_FORMATS]
+    if unknown:
+        raise ValueError(f"Formats desconeguts: {unknown}. Opcions: {list(WEB_FORMATS)}")
+    if 'webp' in formats and 'webp_lossless' in formats:
+        raise ValueError("'webp' i 'webp_lossless' escriurien el mateix fitxer")
+
+    images = []
+    data = {}
+    source_bytes = 0
+    for root, _, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        os.makedirs(os.path.join(dst_dir, rel_root), exist_ok=True)
+        for name in sorted(files):
+            src_path = os.path.join(root, name)
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            stem, ext = os.path.splitext(rel_path)
+            if ext.lower() == '.png':
+                source_bytes += os.path.getsize(src_path)
+                images.append((src_path, dst_dir, stem, tuple(formats), width, quality, colors))
+            else:
+                dst_path = os.path.join(dst_dir, rel_path)
+                shutil.copyfile(src_path, dst_path)
+                data[rel_path.replace(os.sep, '/')] = _file_entry(dst_path, rel_path)
+
+    if max_workers == 1:
+        results = [_export_image(*args) for args in images]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_export_image, *zip(*images))) if images else []
+
+    layers = dict(sorted(results))
+    manifest = {
+        'formats': list(formats),
+        'width': width,
+        'source_bytes': source_bytes,
+        'total_bytes': {fmt: sum(layer[fmt]['bytes'] for layer in layers.values()) for fmt in formats},
+        'layers': layers,
+        'data': data,
+    }
+    with open(os.path.join(dst_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    return manifest
+
+
+def _frame_folders(src_dir):
+    # Carpetes dels passos de l'animació en ordre: cada dècada seguida dels seus interpolats
+    decades = sorted((name for name in os.listdir(src_dir) if name.isdigit()), key=int)
+    folders = []
+    for decade in decades:
+        folders.append(decade)
+        interpolated = [
+            name for name in os.listdir(os.path.join(src_dir, decade))
+            if name.startswith('interpolated_') and os.path.isdir(os.path.join(src_dir, decade, name))
+        ]
+        folders.extend(f'{decade}/{name}' for name in sorted(interpolated, key=lambda n: int(n.split('_')[1])))
+    return folders
+
+
+def _save_atlas_file(image, dst_dir, name, fmt, quality, colors):
+    rel_path = f'atlas/{name}{WEB_FORMATS[fmt]}'
+    dst_path = os.path.join(dst_dir, rel_path)
+    save_web_image(image, dst_path, fmt, quality=quality, colors=colors)
+    entry = _file_entry(dst_path, rel_path)
+    entry['size'] = list(image.size)
+    return entry
+
+
+def _decoration_strip(decorations):
+    """
+    Les decoracions de les dècades només canvien en el text 'Decade N': retorna el requadre
+    (x0, y0, x1, y1) on difereixen, o None si són totes iguals.
+    """
+    reference = np.asarray(decorations[0])
+    changed = np.zeros(reference.shape[:2], dtype=bool)
+    for image in decorations[1:]:
+        changed |= (np.asarray(image) != reference).any(axis=2)
+    if not changed.any():
+        return None
+    rows = np.flatnonzero(changed.any(axis=1))
+    cols = np.flatnonzero(changed.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def export_atlases(src_dir='plots', dst_dir='img', fmt='webp', width=1200, columns=None, quality=85, colors=256):
+    """
+    Empaqueta els frames de cada tipus de capa (mapa de dades i capa de cada gènere) en un sol
+    sprite sheet per tipus, i escriu 'atlas.json' amb la posició de cada frame dins el seu atlas.
+    La decoració es desa un sol cop com a fons, més una tira amb el text de cada dècada.
+    'width' és l'amplada de cada frame dins l'atlas (None = la resolució original).
+    """
+    if fmt not in WEB_FORMATS:
+        raise ValueError(f"Format desconegut: {fmt}. Opcions: {list(WEB_FORMATS)}")
+
+    folders = _frame_folders(src_dir)
+    os.makedirs(os.path.join(dst_dir, 'atlas'), exist_ok=True)
+
+    # Tipus de capa per frame (les decoracions només existeixen a les dècades)
+    layer_frames = {}
+    for folder in folders:
+        for name in sorted(os.listdir(os.path.join(src_dir, folder))):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() == '.png' and stem != 'genre_map_decoration':
+                layer_frames.setdefault(stem, []).append(folder)
+
+    def load(folder, stem):
+        return resize_rgba(Image.open(os.path.join(src_dir, folder, f'{stem}.png')).convert('RGBA'), width)
+
+    manifest = {'frames': folders, 'layers': {}}
+    for stem, frames in layer_frames.items():
+        images = [load(folder, stem) for folder in frames]
+        frame_w, frame_h = images[0].size
+        n_cols = columns or int(np.ceil(np.sqrt(len(images))))
+        n_rows = int(np.ceil(len(images) / n_cols))
+        if fmt != 'png' and max(n_cols * frame_w, n_rows * frame_h) > 16383:
+            raise ValueError(f"L'atlas de '{stem}' supera la mida màxima de WebP: redueix 'width'")
+
+        atlas = Image.new('RGBA', (n_cols * frame_w, n_rows * frame_h))
+        offsets = {}
+        for i, (folder, image) in enumerate(zip(frames, images)):
+            x, y = (i % n_cols) * frame_w, (i // n_cols) * frame_h
+            atlas.paste(image, (x, y))
+            offsets[folder] = [x, y]
+
+        entry = _save_atlas_file(atlas, dst_dir, stem, fmt, quality, colors)
+        entry.update({'frame_size': [frame_w, frame_h], 'offsets': offsets})
+        manifest['layers'][stem] = entry
+
+    # Decoració: fons comú sense el text i una tira amb el text de cada dècada
+    decades = [folder for folder in folders
+               if os.path.exists(os.path.join(src_dir, folder, 'genre_map_decoration.png'))]
+    if decades:
+        decorations = [load(folder, 'genre_map_decoration') for folder in decades]
+        box = _decoration_strip(decorations)
+
+        background = decorations[0].copy()
+        decoration = {'frame_size': list(background.size)}
+        if box is not None:
+            x0, y0, x1, y1 = box
+            background.paste((0, 0, 0, 0), box)
+
+            strip = Image.new('RGBA', (x1 - x0, (y1 - y0) * len(decades)))
+            offsets = {}
+            for i, (folder, image) in enumerate(zip(decades, decorations)):
+                strip.paste(image.crop(box), (0, i * (y1 - y0)))
+                offsets[folder] = [0, i * (y1 - y0)]
+
+            decoration['strip'] = _save_atlas_file(strip, dst_dir, 'genre_map_decoration_text', fmt, quality, colors)
+            decoration['strip'].update({'box': [x0, y0, x1 - x0, y1 - y0], 'offsets': offsets})
+        decoration['background'] = _save_atlas_file(background, dst_dir, 'genre_map_decoration', fmt, quality, colors)
+        manifest['decoration'] = decoration
+
+    with open(os.path.join(dst_dir, 'atlas.json'), 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    return manifest